@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- #
+
+############################################################################
+# IMPORTS
+############################################################################
+
+import os
+import re
+import sys
+import io
+import gzip
+import shutil
+import hashlib
+import argparse
+import posixpath
+from html.parser import HTMLParser
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+############################################################################
+# Static site asset pipeline for the W241 project website
+#
+# Post-processes the generated site (default : ../static-site) in five steps:
+#   1. scan every page for the tags / classes / ids / scripts it actually uses
+#   2. strip the CSS rules no page in a bundle can match
+#   3. bundle + minify the surviving CSS (and the page's local JS)
+#   4. write bundles under content-hashed filenames for long-lived caching
+#   5. emit precompressed .gz (and .br, if `brotli` is installed - it is not
+#      in the Pipfile; a warning says when .br files are skipped) siblings
+# and finally reports the bytes saved per page.
+#
+# usage : python asset_pipeline.py [--site ../static-site] [--output ../static-site-dist] [--in-place]
+############################################################################
+
+BUNDLE_DIR = 'theme/bundle'
+HASH_LENGTH = 10
+COMPRESSIBLE = ('.html', '.css', '.js', '.svg', '.json', '.xml', '.txt')
+
+# selectors that only ever match elements created or toggled at runtime
+SAFELIST = {'in', 'open', 'active', 'collapsing', 'fade', 'show', 'affix',
+    'is-fixed', 'is-visible', 'tooltip', 'popover', 'modal-backdrop', 'dropdown-backdrop'}
+
+# at-rules whose bodies are kept verbatim / pruned recursively
+KEEP_AT_RULES = ('@font-face', '@keyframes', '@-webkit-keyframes', '@-moz-keyframes',
+    '@-o-keyframes', '@page', '@viewport', '@-ms-viewport')
+NESTED_AT_RULES = ('@media', '@supports', '@document', '@-moz-document')
+
+LINK_RE = re.compile(r'<link\b[^>]*>', re.I)
+SCRIPT_RE = re.compile(r'<script\b[^>]*\bsrc\s*=\s*["\'][^"\']+["\'][^>]*>\s*</script>', re.I)
+ATTR_RE = re.compile(r'([\w-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+GAP_RE = re.compile(r'^(?:\s|<!--.*?-->)*$', re.S)
+URL_RE = re.compile(r'url\(\s*(["\']?)([^"\')]+)\1\s*\)', re.I)
+CSS_COMMENT_OR_STRING_RE = re.compile(r'/\*.*?\*/|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'', re.S)
+JS_STRING_RE = re.compile(r'"([^"\\\n]*)"|\'([^\'\\\n]*)\'')
+TOKEN_RE = re.compile(r'[A-Za-z_][\w-]*')
+
+#---------------------------------------------------------------------------
+## HTML scanning
+#---------------------------------------------------------------------------
+
+class UsageCollector(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags, self.classes, self.ids = set(), set(), set()
+        self.inline_js = []
+        self._in_script = False
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.add(tag.lower())
+        for k, v in attrs:
+            if v is None:
+                continue
+            if k == 'class':
+                self.classes.update(v.split())
+            elif k == 'id':
+                self.ids.add(v.strip())
+        self._in_script = (tag.lower() == 'script')
+
+    def handle_endtag(self, tag):
+        self._in_script = False
+
+    def handle_data(self, data):
+        if self._in_script:
+            self.inline_js.append(data)
+
+def get_attrs(tag):
+    return {m.group(1).lower(): m.group(2) if m.group(2) is not None else m.group(3)
+        for m in ATTR_RE.finditer(tag)}
+
+def resolve_local(site_dir, page_path, url):
+    # returns the on-disk path of a same-site asset, or None for remote / missing assets
+    if not url or re.match(r'^(?:[a-z]+:)?//', url, re.I) or url.startswith('data:'):
+        return None
+    url = url.split('#')[0].split('?')[0]
+    if url.startswith('/'):
+        rel = url.lstrip('/')
+    else:
+        rel = posixpath.normpath(posixpath.join(posixpath.dirname(page_path), url))
+    path = os.path.join(site_dir, *rel.split('/'))
+    return rel if os.path.isfile(path) else None
+
+def js_tokens(js):
+    # every word-like token inside a JS string literal is treated as a potential
+    # class / id, which keeps runtime-toggled selectors (e.g. addClass('is-fixed'))
+    tokens = set()
+    for m in JS_STRING_RE.finditer(js):
+        tokens.update(TOKEN_RE.findall(m.group(1) or m.group(2) or ''))
+    return tokens
+
+#---------------------------------------------------------------------------
+## CSS pruning & minification
+#---------------------------------------------------------------------------
+
+def strip_comments(css):
+    return re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+
+def split_blocks(css):
+    # yields (prelude, body) for block rules and (statement, None) for ';' at-rules
+    i, n = 0, len(css)
+    while i < n:
+        j = i
+        while j < n and css[j] not in '{;':
+            if css[j] in '"\'':
+                j = css.index(css[j], j + 1) if css.find(css[j], j + 1) != -1 else n
+            j += 1
+        if j >= n:
+            break
+        prelude = css[i:j].strip()
+        if css[j] == ';':
+            if prelude:
+                yield prelude, None
+            i = j + 1
+            continue
+        depth, k = 1, j + 1
+        while k < n and depth:
+            c = css[k]
+            if c in '"\'':
+                end = css.find(c, k + 1)
+                k = end if end != -1 else n
+            elif c == '{':
+                depth += 1
+            elif c == '}':
+                depth -= 1
+            k += 1
+        yield prelude, css[j + 1:k - 1]
+        i = k
+
+def split_selectors(prelude):
+    out, depth, cur = [], 0, ''
+    for c in prelude:
+        if c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        if c == ',' and depth == 0:
+            out.append(cur.strip())
+            cur = ''
+        else:
+            cur += c
+    out.append(cur.strip())
+    return [s for s in out if s]
+
+def selector_used(selector, used):
+    # a selector survives when every tag / class / id it names appears somewhere in
+    # the pages; pseudo-classes and attribute filters are ignored (kept conservatively)
+    s = re.sub(r'\[[^\]]*\]', '', selector)
+    s = re.sub(r'::?[\w-]+(\([^)]*\))?', '', s)
+    s = s.replace('\\', '')
+    classes = re.findall(r'\.([\w-]+)', s)
+    ids = re.findall(r'#([\w-]+)', s)
+    tags = [t.lower() for t in re.findall(r'(?:^|[\s>+~])([a-zA-Z][\w-]*)', s)]
+    return all(c in used['classes'] for c in classes) \
+        and all(i in used['ids'] for i in ids) \
+        and all(t in used['tags'] or t in ('html', 'body') for t in tags)
+
+def prune_css(css, used):
+    out = []
+    for prelude, body in split_blocks(strip_comments(css)):
+        lower = prelude.lower()
+        if body is None:
+            out.append(prelude + ';')
+        elif lower.startswith(NESTED_AT_RULES):
+            inner = prune_css(body, used)
+            if inner:
+                out.append('%s{%s}' % (prelude, inner))
+        elif lower.startswith('@'):
+            if lower.startswith(KEEP_AT_RULES):
+                out.append('%s{%s}' % (prelude, body))
+        else:
+            keep = [s for s in split_selectors(prelude) if selector_used(s, used)]
+            if keep and body.strip():
+                out.append('%s{%s}' % (','.join(keep), body))
+    return ''.join(out)
+
+def minify_css(css):
+    # quoted strings (content: " , > ", font names, url("...")) are set aside so
+    # the whitespace rules below never touch them; comments go in the same pass
+    strings = []
+    def stash(m):
+        if m.group(0).startswith('/*'):
+            return ''
+        strings.append(m.group(0))
+        return '\x00%d\x00' % (len(strings) - 1)
+    css = CSS_COMMENT_OR_STRING_RE.sub(stash, css)
+
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r'([;{]\s*[\w-]+):\s+', r'\1:', css)
+    css = css.replace(';}', '}')
+    return re.sub(r'\x00(\d+)\x00', lambda m: strings[int(m.group(1))], css.strip())
+
+def rebase_urls(css, css_rel):
+    # bundles live in a different directory, so relative url(...) references are
+    # rewritten to site-absolute paths
+    base = posixpath.dirname(css_rel)
+
+    def fix(m):
+        url = m.group(2).strip()
+        if re.match(r'^(?:[a-z]+:|/|#)', url, re.I):
+            return m.group(0)
+        return 'url(%s)' % ('/' + posixpath.normpath(posixpath.join(base, url)))
+
+    return URL_RE.sub(fix, css)
+
+#---------------------------------------------------------------------------
+## Bundling
+#---------------------------------------------------------------------------
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+def write_bytes(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(payload)
+
+def fingerprint(payload):
+    return hashlib.sha256(payload).hexdigest()[:HASH_LENGTH]
+
+def prefer_minified(site_dir, rel):
+    root, ext = posixpath.splitext(rel)
+    if root.endswith('.min'):
+        return rel
+    alt_rel = root + '.min' + ext
+    return alt_rel if os.path.isfile(os.path.join(site_dir, *alt_rel.split('/'))) else rel
+
+def write_bundle(site_dir, kind, payload):
+    name = '%s/%s.%s.%s' % (BUNDLE_DIR, 'styles' if kind == 'css' else 'scripts', fingerprint(payload), kind)
+    write_bytes(os.path.join(site_dir, *name.split('/')), payload)
+    return name
+
+def find_pages(site_dir):
+    pages = []
+    for root, dirs, files in os.walk(site_dir):
+        dirs[:] = [d for d in dirs if d != 'theme']
+        for f in files:
+            if f.endswith('.html'):
+                pages.append(os.path.relpath(os.path.join(root, f), site_dir).replace(os.sep, '/'))
+    return sorted(pages)
+
+def scan_page(site_dir, rel):
+    html = read_text(os.path.join(site_dir, *rel.split('/')))
+
+    styles = []
+    for m in LINK_RE.finditer(html):
+        a = get_attrs(m.group(0))
+        if 'stylesheet' in a.get('rel', '').lower():
+            local = resolve_local(site_dir, rel, a.get('href'))
+            if local:
+                styles.append((m.start(), m.end(), local))
+
+    scripts = []
+    for m in SCRIPT_RE.finditer(html):
+        local = resolve_local(site_dir, rel, get_attrs(m.group(0)).get('src'))
+        if local:
+            scripts.append((m.start(), m.end(), local))
+
+    collector = UsageCollector()
+    collector.feed(html)
+    js = ''.join(collector.inline_js)
+    for _, _, s in scripts:
+        js += read_text(os.path.join(site_dir, *s.split('/')))
+    tokens = js_tokens(js)
+
+    used = {'tags': collector.tags,
+        'classes': collector.classes | tokens | SAFELIST,
+        'ids': collector.ids | tokens}
+
+    return {'page': rel, 'html': html, 'styles': styles, 'scripts': scripts, 'used': used}
+
+def script_runs(html, scripts):
+    # only adjacent <script src> tags are merged so execution order relative to
+    # inline scripts is preserved
+    runs = []
+    for s in scripts:
+        if runs and GAP_RE.match(html[runs[-1][-1][1]:s[0]]):
+            runs[-1].append(s)
+        else:
+            runs.append([s])
+    return runs
+
+def rewrite_html(html, replacements):
+    # replacements : list of (start, end, new_text), non-overlapping
+    out, pos = [], 0
+    for start, end, text in sorted(replacements):
+        out.append(html[pos:start])
+        out.append(text)
+        pos = end
+    out.append(html[pos:])
+    return ''.join(out)
+
+def copy_site(site_dir, output_dir):
+    # explicit walk : copytree(dirs_exist_ok=) needs Python 3.8
+    for root, _, files in os.walk(site_dir):
+        dest = os.path.join(output_dir, os.path.relpath(root, site_dir))
+        os.makedirs(dest, exist_ok=True)
+        for f in files:
+            shutil.copy2(os.path.join(root, f), os.path.join(dest, f))
+
+def build(site_dir, output_dir=None, in_place=False):
+
+    if in_place:
+        output_dir = None
+    elif not output_dir or os.path.abspath(output_dir) == os.path.abspath(site_dir):
+        raise ValueError('pass a separate output_dir, or in_place=True to rewrite %s' % site_dir)
+    else:
+        copy_site(site_dir, output_dir)
+        site_dir = output_dir
+
+    pages = [scan_page(site_dir, p) for p in find_pages(site_dir)]
+
+    # pages that share the same stylesheet list share one (cacheable) bundle whose
+    # selectors are the union of what those pages use
+    groups = {}
+    for p in pages:
+        key = tuple(s for _, _, s in p['styles'])
+        if key:
+            g = groups.setdefault(key, {'tags': set(), 'classes': set(), 'ids': set()})
+            for k in g:
+                g[k] |= p['used'][k]
+
+    css_bundles = {}
+    for key, used in groups.items():
+        css = ''.join(rebase_urls(prune_css(read_text(os.path.join(site_dir, *s.split('/'))), used), s)
+            for s in key)
+        css_bundles[key] = write_bundle(site_dir, 'css', minify_css(css).encode('utf-8'))
+
+    js_bundles, emitted, report = {}, set(css_bundles.values()), []
+    for p in pages:
+        html, replacements, before = p['html'], [], set()
+
+        key = tuple(s for _, _, s in p['styles'])
+        if key:
+            href = '/' + css_bundles[key]
+            replacements.append((p['styles'][0][0], p['styles'][0][1], '<link href="%s" rel="stylesheet">' % href))
+            replacements += [(a, b, '') for a, b, _ in p['styles'][1:]]
+            before.update(key)
+
+        for run in script_runs(html, p['scripts']):
+            rkey = tuple(prefer_minified(site_dir, s) for _, _, s in run)
+            if rkey not in js_bundles:
+                js = ';\n'.join(read_text(os.path.join(site_dir, *s.split('/'))).strip() for s in rkey)
+                js_bundles[rkey] = write_bundle(site_dir, 'js', (js + '\n').encode('utf-8'))
+            replacements.append((run[0][0], run[0][1], '<script src="/%s"></script>' % js_bundles[rkey]))
+            replacements += [(a, b, '') for a, b, _ in run[1:]]
+            before.update(s for _, _, s in run)
+
+        new_html = rewrite_html(html, replacements)
+        page_path = os.path.join(site_dir, *p['page'].split('/'))
+        write_bytes(page_path, new_html.encode('utf-8'))
+
+        after = {css_bundles[key]} if key else set()
+        after.update(js_bundles[tuple(prefer_minified(site_dir, s) for _, _, s in run)]
+            for run in script_runs(html, p['scripts']))
+        emitted.update(after)
+
+        size = lambda rel: os.path.getsize(os.path.join(site_dir, *rel.split('/')))
+        report.append({'page': p['page'],
+            'before': len(html.encode('utf-8')) + sum(size(s) for s in before),
+            'after': len(new_html.encode('utf-8')) + sum(size(s) for s in after),
+            'after_gz': len(gzip_bytes(new_html.encode('utf-8'))) + sum(len(gzip_bytes(read_bytes(site_dir, s))) for s in after)})
+
+    if brotli is None:
+        sys.stderr.write('warning : brotli is not installed, writing .gz only (pip install brotli for .br)\n')
+    for rel in sorted(emitted) + [p['page'] for p in pages]:
+        precompress(os.path.join(site_dir, *rel.split('/')))
+
+    return report
+
+#---------------------------------------------------------------------------
+## Precompression & reporting
+#---------------------------------------------------------------------------
+
+def read_bytes(site_dir, rel):
+    with open(os.path.join(site_dir, *rel.split('/')), 'rb') as f:
+        return f.read()
+
+def gzip_bytes(payload):
+    # mtime=0 keeps the .gz output byte-for-byte reproducible between builds
+    # (GzipFile rather than gzip.compress, whose mtime argument needs Python 3.8)
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(payload)
+    return buf.getvalue()
+
+def precompress(path):
+    if not path.endswith(COMPRESSIBLE):
+        return
+    with open(path, 'rb') as f:
+        payload = f.read()
+    write_bytes(path + '.gz', gzip_bytes(payload))
+    if brotli is not None:
+        write_bytes(path + '.br', brotli.compress(payload, quality=11))
+
+def print_report(report, out=sys.stdout):
+    width = max([len(r['page']) for r in report] + [4])
+    out.write('%-*s %12s %12s %12s %8s\n' % (width, 'page', 'before', 'after', 'after (gz)', 'saved'))
+    for r in report:
+        saved = 1 - r['after'] / r['before'] if r['before'] else 0.
+        out.write('%-*s %12d %12d %12d %7.1f%%\n' % (width, r['page'], r['before'], r['after'], r['after_gz'], saved * 100))
+    total_before = sum(r['before'] for r in report)
+    total_after = sum(r['after'] for r in report)
+    out.write('%-*s %12d %12d %12d %7.1f%%\n' % (width, 'TOTAL', total_before, total_after,
+        sum(r['after_gz'] for r in report), (1 - total_after / total_before) * 100 if total_before else 0.))
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Prune, bundle, fingerprint and precompress static site assets.')
+    parser.add_argument('--site', default=os.path.join(here, '..', 'static-site'), help='generated site directory')
+    parser.add_argument('--output', default=os.path.join(here, '..', 'static-site-dist'),
+        help='directory the processed site is written to')
+    parser.add_argument('--in-place', action='store_true', help='rewrite --site itself (ignores --output)')
+    args = parser.parse_args()
+
+    print_report(build(args.site, args.output, in_place=args.in_place))
@@ -0,0 +1,175 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from demographics import normalize_demographics
+from data_catalog import cohort_labels
+
+############################################################################
+# Covariate balance across treatment arms
+#
+# Works on the per-participant table (one row per ROWID). Every covariate is
+# expanded into one design matrix - a 0/1 column per level of a categorical,
+# one column per numeric - and all arm-wise statistics come from a single
+# pass of matrix products with the arm indicator :
+#
+#   arm distributions       % of each arm at each level / arm means
+#   standardized mean diff  each arm vs Control, pooled sd (as cobalt's bal.tab)
+#   per-covariate tests     chi-square (categorical), one-way ANOVA (numeric)
+#   joint test              permutation test of all covariates at once; the
+#                           draws are stacked in memory-bounded chunks and
+#                           scored with one matrix product per arm
+#
+#   table, joint = balance_table(df)
+############################################################################
+
+ARM_COL = 'Treatment'
+CONTROL = 'Control'
+
+CATEGORICAL = ['cohort', 'Gender_norm', 'English', 'Race', 'isUS', 'Student', 'Degree',
+    'age_bins', 'ReadSocialMedia', 'WriteSocialMedia']
+NUMERIC = ['age']
+
+SMD_THRESHOLD = 0.1
+
+#---------------------------------------------------------------------------
+## Per-participant table
+#---------------------------------------------------------------------------
+
+def participant_table(df, id_col='ROWID'):
+    # demographics and treatment are constant within a participant
+    p = df.drop_duplicates(subset=[id_col]).copy()
+    p = normalize_demographics(p, columns=[c for c in ['Year', 'Country', 'Gender'] if c in p.columns])
+    if 'Start Date' in p.columns:
+        p['cohort'] = cohort_labels(p['Start Date'])
+    if 'age' in p.columns:
+        # age 0 marks an unknown birth year in the R convention; treat it as missing here
+        p['age'] = p.age.where(p.age > 0)
+    return p.reset_index(drop=True)
+
+#---------------------------------------------------------------------------
+## Design matrix
+#---------------------------------------------------------------------------
+
+def _design(p, categorical, numeric):
+    blocks, rows = [], []
+    for c in categorical:
+        # missing is a level of its own : differential missingness is imbalance too
+        codes, levels = pd.factorize(p[c].astype(object).where(p[c].notna(), '<MISSING>'), sort=True)
+        blocks.append(np.eye(len(levels))[codes])
+        rows += [(c, str(l), 'categorical') for l in levels]
+    for c in numeric:
+        blocks.append(pd.to_numeric(p[c], errors='coerce').values.astype(np.float64)[:, None])
+        rows.append((c, 'mean', 'numeric'))
+    return np.hstack(blocks), pd.DataFrame(rows, columns=['Covariate', 'Level', 'kind'])
+
+#---------------------------------------------------------------------------
+## Joint permutation test
+#---------------------------------------------------------------------------
+
+def _between_ss(Z, codes, n_a):
+    # sum over columns of the between-arm sum of squares of standardized Z
+    # codes : (draws x n) arm codes; one BLAS product per arm, no one-hot tensor
+    S = np.stack([(codes == a).astype(np.float64) @ Z for a in range(len(n_a))], axis=1)
+    return (S ** 2 / n_a[None, :, None]).sum(axis=(1, 2))
+
+def permutation_test(X, arm_codes, n_arms, draws=2000, seed=241, max_chunk_bytes=64 * 2**20):
+    """
+    joint test of all covariate columns : standardized column-wise, statistic is
+    the total between-arm sum of squares (large when any column differs by arm)
+    """
+    # mean-impute numerics so a missing value carries no arm signal
+    X = np.where(np.isnan(X), np.nanmean(X, axis=0), X)
+    sd = X.std(axis=0)
+    keep = sd > 0
+    Z = (X[:, keep] - X[:, keep].mean(axis=0)) / sd[keep]
+
+    # arm sizes are fixed under permutation
+    n_a = np.bincount(arm_codes, minlength=n_arms).astype(np.float64)
+    observed = _between_ss(Z, arm_codes[None, :], n_a)[0]
+
+    # draws per chunk sized so the (draws x n) label and mask arrays stay bounded
+    chunk = int(max(1, min(draws, max_chunk_bytes // (8 * len(arm_codes)))))
+    rng = np.random.default_rng(seed)
+    null = np.empty(draws)
+    for start in range(0, draws, chunk):
+        b = min(chunk, draws - start)
+        perms = rng.permuted(np.tile(arm_codes, (b, 1)), axis=1)
+        null[start:start + b] = _between_ss(Z, perms, n_a)
+
+    return {'statistic':observed, 'p_value':(1. + np.sum(null >= observed)) / (draws + 1.),
+        'draws':draws, 'columns':int(keep.sum())}
+
+#---------------------------------------------------------------------------
+## Balance table
+#---------------------------------------------------------------------------
+
+def balance_table(df, categorical=None, numeric=None, arm_col=ARM_COL, control=CONTROL,
+    draws=2000, seed=241, participant_level=False):
+    """
+    df : response-level frame (collapsed to participants) or, with
+    participant_level=True, the per-participant table itself
+    returns (table, joint) : one row per covariate level, and the joint permutation test
+    """
+    p = df if participant_level else participant_table(df)
+    p = p[p[arm_col].notna()]
+    categorical = [c for c in (categorical or CATEGORICAL) if c in p.columns]
+    numeric = [c for c in (numeric or NUMERIC) if c in p.columns]
+
+    arms = [control] + sorted(a for a in p[arm_col].unique() if a != control)
+    arm_codes = pd.Categorical(p[arm_col], categories=arms).codes
+    G = np.eye(len(arms))[arm_codes]
+
+    X, rows = _design(p, categorical, numeric)
+    W = ~np.isnan(X)
+    X0 = np.where(W, X, 0.)
+
+    # the single pass : per-arm counts, sums and sums of squares for every column
+    n = G.T @ W
+    s1 = G.T @ X0
+    s2 = G.T @ (X0 ** 2)
+    mean = s1 / n
+    var = np.maximum(s2 / n - mean ** 2, 0.) * n / np.maximum(n - 1, 1)
+
+    table = rows.copy()
+    for i, a in enumerate(arms):
+        table[a] = np.where(table.kind == 'categorical', mean[i] * 100, mean[i])
+    for i, a in enumerate(arms[1:], start=1):
+        pooled = np.sqrt((var[i] + var[0]) / 2.)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            table['SMD ' + a] = np.where(pooled > 0, (mean[i] - mean[0]) / pooled, 0.)
+    smd_cols = ['SMD ' + a for a in arms[1:]]
+    table['Max |SMD|'] = table[smd_cols].abs().max(axis=1)
+
+    # per-covariate omnibus tests from the same sums
+    tests = []
+    for c, idx in table.groupby(by='Covariate', sort=False).groups.items():
+        idx = np.asarray(idx)
+        if table.kind[idx[0]] == 'categorical':
+            obs = s1[:, idx]
+            obs = obs[:, obs.sum(axis=0) > 0]
+            expected = obs.sum(axis=1, keepdims=True) * obs.sum(axis=0, keepdims=True) / obs.sum()
+            chi2 = np.sum((obs - expected) ** 2 / expected)
+            dof = (obs.shape[0] - 1) * (obs.shape[1] - 1)
+            tests.append((c, 'Chi-square', chi2, dof, stats.chi2.sf(chi2, dof) if dof else np.nan))
+        else:
+            j = idx[0]
+            grand = s1[:, j].sum() / n[:, j].sum()
+            ssb = np.sum(n[:, j] * (mean[:, j] - grand) ** 2)
+            ssw = np.sum(s2[:, j] - n[:, j] * mean[:, j] ** 2)
+            df1, df2 = len(arms) - 1, n[:, j].sum() - len(arms)
+            f = (ssb / df1) / (ssw / df2)
+            tests.append((c, 'ANOVA F', f, df1, stats.f.sf(f, df1, df2)))
+    tests = pd.DataFrame(tests, columns=['Covariate', 'Test', 'Statistic', 'df', 'p-value'])
+
+    table = table.merge(tests, how='left', on='Covariate').drop(columns='kind')\
+        .set_index(['Covariate', 'Level'])
+
+    joint = permutation_test(X, arm_codes, len(arms), draws=draws, seed=seed)
+    joint['n'] = dict(zip(arms, np.bincount(arm_codes, minlength=len(arms)).tolist()))
+
+    return table, joint
@@ -0,0 +1,206 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import io
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+import pandas as pd
+import altair as alt
+from matplotlib import pyplot as plt
+
+import plot_utils as pu
+from mixed import fit_lmm
+from synthetic import generate_results, SCALES
+
+############################################################################
+# Benchmark suite for the plot_utils chart & analysis pipeline
+#
+# Times every plot_utils data / chart function (and the divergence prep)
+# against synthetic data at 1x, 10x, 100x and 1000x the live study, with
+# peak traced memory. Charts are materialized the way the notebook consumes
+# them (altair -> spec dict, Styler -> HTML, matplotlib -> PNG) so inlining
+# and rendering costs are included.
+#
+#   python benchmarks.py --save                  # record a new baseline
+#   python benchmarks.py --compare               # fail on regressions
+#
+# Each result also carries a scaling exponent against the previous scale
+# (1.0 = linear); anything above --cliff flags a scaling cliff. Once a
+# function exceeds --max-seconds at one scale, larger scales are skipped.
+############################################################################
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'benchmark_baseline.json')
+
+#---------------------------------------------------------------------------
+## Benchmark cases : name -> callable(df)
+#---------------------------------------------------------------------------
+
+def _live_counts(df):
+    return pu.participant_count_plot_live(df)
+
+def _pilot_counts(df):
+    # participant_count_plot expects the pre-aggregated [treatment, total] frame
+    d = df.groupby(by=['ROWID','Treatment']).size().reset_index()[['ROWID','Treatment']]\
+        .groupby(by='Treatment').size().reset_index().rename(columns={0:'total', 'Treatment':'treatment'})
+    return pu.participant_count_plot(d)
+
+def _macro_diverge(df):
+    return pu.macro_diverge_plot(pu.get_divergence_data(df), 'intelligence', '')
+
+CASES = [
+    ('get_divergence_data', pu.get_divergence_data),
+    ('macro_diverge_plot', _macro_diverge),
+    ('participant_count_plot', _pilot_counts),
+    ('participant_count_plot_live', _live_counts),
+    ('get_missing_demographics', pu.get_missing_demographics),
+    ('get_balance_report', pu.get_balance_report),
+    ('get_good_demographic_year', pu.get_good_demographic_year),
+    ('get_demographic_gender', pu.get_demographic_gender),
+    ('get_demographic_country', pu.get_demographic_country),
+    ('get_demographic_state', pu.get_demographic_state),
+    ('get_demographic_student_status', pu.get_demographic_student_status),
+    ('get_descriptive_statistics', lambda df: pu.get_descriptive_statistics(df,
+        ['PromptTime','QuestionTime','wpm','Interest','Effective','Intelligence','Writing','Meet'])),
+    ('get_likert_variance', pu.get_likert_variance),
+    ('get_likert_counts_by_group', pu.get_likert_counts_by_group),
+    ('get_wpm_plot', pu.get_wpm_plot),
+    # analysis models
+    ('fit_lmm', lambda df: fit_lmm(df, 'Intelligence ~ Treatment + length + mistakes',
+        groups=['ROWID','Prompt'])),
+]
+
+def materialize(result):
+    if result is plt:
+        buf = io.BytesIO()
+        plt.savefig(buf, format='png')
+        plt.close('all')
+        return
+    if hasattr(result, 'render'):
+        result.render()
+    elif hasattr(result, 'to_dict'):
+        result.to_dict()
+
+#---------------------------------------------------------------------------
+## Runner
+#---------------------------------------------------------------------------
+
+def time_case(func, df, repeat=3):
+
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        materialize(func(df))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # memory is measured on a separate run so tracing doesn't skew the timings
+    gc.collect()
+    tracemalloc.start()
+    materialize(func(df))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, peak
+
+def run(scales=SCALES, cases=None, repeat=3, max_seconds=60., seed=0, out=sys.stdout):
+
+    # charts at 10x and beyond exceed altair's default 5,000 row guard
+    alt.data_transformers.disable_max_rows()
+
+    cases = [c for c in CASES if not cases or c[0] in cases]
+    results, over_budget = [], set()
+
+    for scale in sorted(scales):
+        df = generate_results(scale=scale, seed=seed)
+        for name, func in cases:
+            if name in over_budget:
+                results.append({'case':name, 'scale':scale, 'rows':df.shape[0],
+                    'seconds':None, 'peak_bytes':None, 'status':'skipped'})
+                continue
+            seconds, peak = time_case(func, df, repeat=1 if scale >= 100 else repeat)
+            results.append({'case':name, 'scale':scale, 'rows':df.shape[0],
+                'seconds':seconds, 'peak_bytes':peak, 'status':'ok'})
+            out.write('%-32s %6dx %10d rows %10.4fs %10.1f MB\n' % (name, scale, df.shape[0], seconds, peak / 2**20))
+            out.flush()
+            if seconds > max_seconds:
+                over_budget.add(name)
+
+    return add_scaling(pd.DataFrame(results))
+
+def add_scaling(res):
+    # empirical exponent b in time ~ rows^b between consecutive scales
+    res = res.sort_values(by=['case','scale']).reset_index(drop=True)
+    prev = res.groupby(by='case')[['rows','seconds']].shift(1)
+    res['scaling'] = np.log(res.seconds / prev.seconds) / np.log(res.rows / prev.rows)
+    return res
+
+#---------------------------------------------------------------------------
+## Baselines
+#---------------------------------------------------------------------------
+
+def save_baseline(res, path=BASELINE_PATH):
+    payload = {'python': platform.python_version(), 'pandas': pd.__version__, 'altair': alt.__version__,
+        'machine': platform.machine(), 'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': json.loads(res.to_json(orient='records'))}
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=1)
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        raise FileNotFoundError('no benchmark baseline at %s; record one with `python benchmarks.py --save`' % path)
+    with open(path) as f:
+        return pd.DataFrame(json.load(f)['results'])
+
+def compare(res, baseline, tolerance=0.25, cliff=1.5):
+
+    cmp = res.merge(baseline[['case','scale','seconds','peak_bytes']], how='left',
+        on=['case','scale'], suffixes=('','_baseline'))
+    cmp['time_ratio'] = cmp.seconds / cmp.seconds_baseline
+    cmp['memory_ratio'] = cmp.peak_bytes / cmp.peak_bytes_baseline
+    cmp['regression'] = (cmp.time_ratio > 1 + tolerance) | (cmp.memory_ratio > 1 + tolerance)
+    cmp['cliff'] = cmp.scaling > cliff
+    return cmp
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark plot_utils on synthetic data.')
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES)
+    parser.add_argument('--cases', nargs='+', default=None, help='subset of benchmark case names')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=60., help='skip larger scales once a case exceeds this')
+    parser.add_argument('--save', action='store_true', help='write results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='compare against the saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--cliff', type=float, default=1.5, help='scaling exponent that counts as a cliff')
+    args = parser.parse_args()
+
+    # fail before spending minutes on the run; baselines are machine-specific and not committed
+    if args.compare and not os.path.exists(BASELINE_PATH):
+        parser.error('no baseline at %s; run once with --save to record one' % BASELINE_PATH)
+
+    res = run(scales=args.scales, cases=args.cases, repeat=args.repeat, max_seconds=args.max_seconds)
+    failed = False
+
+    if args.compare:
+        cmp = compare(res, load_baseline(), tolerance=args.tolerance, cliff=args.cliff)
+        print(cmp[['case','scale','seconds','seconds_baseline','time_ratio','memory_ratio','scaling','regression','cliff']]
+            .to_string(index=False))
+        failed = bool((cmp.regression | cmp.cliff).any())
+    else:
+        cliffs = res[(res.scaling > args.cliff)]
+        if cliffs.shape[0]:
+            print('\nscaling cliffs (exponent > %.2f):' % args.cliff)
+            print(cliffs[['case','scale','rows','seconds','scaling']].to_string(index=False))
+
+    if args.save:
+        save_baseline(res)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,288 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from collections import OrderedDict
+
+from demographics import normalize_demographics
+
+############################################################################
+# Multi-wave dataset catalog for the W241 typos field experiment
+#
+# Maps every study wave (pilot, live, ...) onto one unified long schema
+# (one row per participant x prompt) and stores it as a hive-partitioned
+# parquet dataset : <root>/wave=<wave>/cohort=<cohort>/*.parquet
+#
+# Reads push column selection and predicates down to the parquet scanner, so
+# a query like "all Phonological XLab rows across waves" only opens the
+# cohort=XLab partitions and only the row groups whose statistics can match:
+#
+#   read_catalog(columns=['participant_id','prompt','intelligence'],
+#       filters=[('cohort','==','XLab'), ('treatment','==','Phonological')])
+############################################################################
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CATALOG_ROOT = os.path.join(DATA_DIR, 'catalog')
+
+PARTITION_COLS = ['wave', 'cohort']
+
+# live study cut-over between the Amazon MTurk and Berkeley XLab cohorts
+# (same boundary used throughout plot_utils)
+XLAB_START = '2021-04-05'
+COHORTS = ['Amazon', 'XLab']
+
+def cohort_labels(start_dates):
+    # the one cohort rule : started before XLAB_START -> Amazon, otherwise XLab
+    return np.where(pd.to_datetime(pd.Series(start_dates).values) < pd.Timestamp(XLAB_START), 'Amazon', 'XLab')
+
+#---------------------------------------------------------------------------
+## Unified Schema
+#---------------------------------------------------------------------------
+
+UNIFIED_SCHEMA = pa.schema([
+    ('participant_id', pa.int64()),
+    ('treatment', pa.string()),
+    ('prompt', pa.string()),
+    ('prompt_num', pa.int8()),
+    ('start_time', pa.timestamp('s')),
+    ('end_time', pa.timestamp('s')),
+    # 7-point Likert outcomes
+    ('effective', pa.int8()),
+    ('intelligence', pa.int8()),
+    ('interest', pa.int8()),
+    ('writing', pa.int8()),
+    ('meet', pa.int8()),
+    ('like', pa.int8()),
+    # manipulation & perception
+    ('knowledge', pa.int8()),
+    ('length', pa.int32()),
+    ('mistakes', pa.int32()),
+    ('length_rating', pa.string()),
+    ('mistakes_reported', pa.string()),
+    ('prompt_time', pa.float64()),
+    ('question_time', pa.float64()),
+    ('wpm', pa.float64()),
+    # demographics
+    ('year', pa.string()),
+    ('age_bin', pa.string()),
+    ('gender', pa.string()),
+    ('english', pa.string()),
+    ('race', pa.string()),
+    ('country', pa.string()),
+    ('state', pa.string()),
+    ('student', pa.string()),
+    ('degree', pa.string()),
+    ('read_social_media', pa.string()),
+    ('write_social_media', pa.string()),
+])
+
+LIKERT_COLS = ['effective', 'intelligence', 'interest', 'writing', 'meet', 'like']
+
+# participant_id is the wave's own id (pilot ID 1..N, live ROWID 1..N) and is
+# only unique within a wave : (wave, participant_id) is the participant key
+PARTICIPANT_KEY = ['wave', 'participant_id']
+
+# pilot question number -> live prompt name, matched on the knowledge question
+# of each post (medal -> Gold / Sports, accident -> Driving / Accident, city ->
+# Chicago, IL / Music, mutated dog -> Science, grammar -> Podcast / Mind; see
+# R-analysis/final_project.Rmd). Q4 (wild animal) was not fielded live.
+PILOT_PROMPTS = {1:'Sports', 2:'Accident', 3:'Music', 4:'Q4', 5:'Science', 6:'Mind'}
+
+# pilot answer options -> the live option with the same meaning, so cross-wave
+# filters on these columns match both waves. Values without a live equivalent
+# are kept as answered : degree 'Trade School' / 'Prefer not to say'.
+# Not unified, and so wave-specific :
+#   gender            pilot asked Female / Male, live offers cis / trans /
+#                     non-binary options; neither maps onto the other
+#   *_social_media    pilot 'Daily' also covers live 'More than once a day'
+PILOT_VALUES = {
+    'degree' : {"Bachelor's Degree":"Bachelor's degree", 'High School':'No college',
+        "Master's Degree":"Advanced degree (Master's, Doctorate)",
+        'Ph.D. or higher':"Advanced degree (Master's, Doctorate)"},
+    'read_social_media' : {'Less Often':'Less than Weekly'},
+    'write_social_media' : {'Less Often':'Less than Weekly'},
+}
+
+# prompt_num is the position of the post in the wave's presentation order
+LIVE_PROMPT_ORDER = ['Diet', 'Sports', 'Accident', 'Music', 'Science', 'Mind']
+
+#---------------------------------------------------------------------------
+## Wave Loaders (source CSV -> unified schema)
+#---------------------------------------------------------------------------
+
+def _conform(df):
+    # add any column this wave doesn't carry, then order / type per UNIFIED_SCHEMA
+    for f in UNIFIED_SCHEMA:
+        if f.name not in df.columns:
+            df[f.name] = np.nan
+    for c in LIKERT_COLS + ['knowledge', 'prompt_num']:
+        df[c] = pd.to_numeric(df[c], errors='coerce').astype('Int8')
+    for c in ['length', 'mistakes']:
+        df[c] = pd.to_numeric(df[c], errors='coerce').astype('Int32')
+    for c in ['start_time', 'end_time']:
+        df[c] = pd.to_datetime(df[c], errors='coerce')
+    for f in UNIFIED_SCHEMA:
+        if pa.types.is_string(f.type):
+            df[f.name] = df[f.name].astype(object).where(df[f.name].notna(), None)
+    return df[[f.name for f in UNIFIED_SCHEMA] + ['cohort']]
+
+def load_pilot(path=os.path.join(DATA_DIR, 'pilot_data_cleaned.csv')):
+
+    df = pd.read_csv(path)
+    out = pd.DataFrame({
+        'participant_id' : df.ID,
+        'treatment' : df.Type.map({'C':'Control', 'T':'Typographical', 'P':'Phonological'}),
+        'prompt' : df.q_num.map(PILOT_PROMPTS),
+        'prompt_num' : df.q_num,
+        'start_time' : pd.to_datetime(df.Start, format='%m/%d/%y %H:%M:%S'),
+        'end_time' : pd.to_datetime(df.End, format='%m/%d/%y %H:%M:%S'),
+        'effective' : df.Effective,
+        'intelligence' : df.Intelligence,
+        'interest' : df.Interest,
+        'writing' : df.Writing,
+        'like' : df.Like,
+        'knowledge' : df.q,
+        'length_rating' : df.Length,
+        'mistakes_reported' : df.Mistakes,
+        # '18 - 25 years old' -> '18-25', the live / R age_bins labels
+        'age_bin' : df.Age.str.replace(' years old', '', regex=False).str.replace(' - ', '-', regex=False),
+        'gender' : df.Gender,
+        'english' : df.English,
+        'degree' : df.Degree,
+        'read_social_media' : df.Read,
+        'write_social_media' : df.Make})
+    for c, values in PILOT_VALUES.items():
+        out[c] = out[c].replace(values)
+    out['cohort'] = 'Pilot'
+
+    return _conform(out)
+
+def load_live(path=os.path.join(DATA_DIR, 'results_cleaned_04092021.csv')):
+
+    df = pd.read_csv(path, dtype={'Year':str})
+    df['Start Date'] = pd.to_datetime(df['Start Date'].values)
+    df = normalize_demographics(df, columns=['Year'])
+
+    out = pd.DataFrame({
+        'participant_id' : df.ROWID,
+        'treatment' : df.Treatment,
+        'prompt' : df.Prompt,
+        'prompt_num' : df.Prompt.map({p:i+1 for i,p in enumerate(LIVE_PROMPT_ORDER)}),
+        'start_time' : df['Start Date'],
+        'effective' : df.Effective,
+        'intelligence' : df.Intelligence,
+        'interest' : df.Interest,
+        'writing' : df.Writing,
+        'meet' : df.Meet,
+        'knowledge' : df.Knowledge,
+        'length' : df.length,
+        'mistakes' : df.mistakes,
+        'length_rating' : df.Length,
+        'mistakes_reported' : df.Errors,
+        'prompt_time' : df.PromptTime,
+        'question_time' : df.QuestionTime,
+        'wpm' : df.wpm,
+        'year' : df.Year,
+        'age_bin' : df.age_bins.astype(str),
+        'gender' : df.Gender,
+        'english' : df.English,
+        'race' : df.Race,
+        'country' : df.Country,
+        'state' : df.State,
+        'student' : df.Student,
+        'degree' : df.Degree,
+        'read_social_media' : df.ReadSocialMedia,
+        'write_social_media' : df.WriteSocialMedia})
+    out['cohort'] = cohort_labels(df['Start Date'])
+
+    return _conform(out)
+
+# wave name -> loader; R-analysis/final_data_cleaned.csv is the live wave plus
+# columns derived in R (age, age_bins, isMechTurk, isUS; see demographics.py)
+# and is not a separate wave
+WAVES = OrderedDict({
+    'pilot' : load_pilot,
+    'live'  : load_live,
+})
+
+#---------------------------------------------------------------------------
+## Catalog Build / Read
+#---------------------------------------------------------------------------
+
+def build_catalog(root=CATALOG_ROOT, waves=None, row_group_size=64 * 1024):
+
+    for wave in (waves or WAVES.keys()):
+        df = WAVES[wave]()
+        df['wave'] = wave
+        # sort so row-group min/max statistics on treatment / prompt are tight
+        # and non-partition predicates can skip row groups
+        df = df.sort_values(by=['cohort', 'treatment', 'prompt', 'participant_id'], kind='mergesort')
+
+        for cohort, part in df.groupby(by='cohort', sort=False):
+            path = os.path.join(root, 'wave=%s' % wave, 'cohort=%s' % cohort)
+            os.makedirs(path, exist_ok=True)
+            for f in os.listdir(path):
+                if f.endswith('.parquet'):
+                    os.remove(os.path.join(path, f))
+            table = pa.Table.from_pandas(part[[f.name for f in UNIFIED_SCHEMA]],
+                schema=UNIFIED_SCHEMA, preserve_index=False)
+            pq.write_table(table, os.path.join(path, 'part-0.parquet'), row_group_size=row_group_size)
+
+    return root
+
+def get_dataset(root=CATALOG_ROOT):
+    partitioning = ds.partitioning(pa.schema([('wave', pa.string()), ('cohort', pa.string())]), flavor='hive')
+    return ds.dataset(root, format='parquet', partitioning=partitioning)
+
+def _to_expression(filters):
+    # filters : list of (column, op, value) tuples, AND-ed together
+    expr = None
+    for col, op, val in filters:
+        f = ds.field(col)
+        if op in ('==', '='):
+            e = f == val
+        elif op == '!=':
+            e = f != val
+        elif op == '<':
+            e = f < val
+        elif op == '<=':
+            e = f <= val
+        elif op == '>':
+            e = f > val
+        elif op == '>=':
+            e = f >= val
+        elif op == 'in':
+            e = f.isin(list(val))
+        elif op == 'not in':
+            e = ~f.isin(list(val))
+        else:
+            raise ValueError("unsupported filter operator '%s'" % op)
+        expr = e if expr is None else expr & e
+    return expr
+
+def read_catalog(columns=None, filters=None, root=CATALOG_ROOT):
+
+    if not os.path.isdir(root):
+        build_catalog(root)
+    # participant ids collide across waves; never return them without the wave
+    if columns is not None and 'participant_id' in columns and 'wave' not in columns:
+        columns = ['wave'] + list(columns)
+
+    table = get_dataset(root).to_table(columns=columns,
+        filter=_to_expression(filters) if filters else None)
+    return table.to_pandas()
+
+def list_partitions(root=CATALOG_ROOT):
+    return pd.DataFrame([{k:v for k,v in (p.split('=') for p in os.path.relpath(d, root).split(os.sep))}
+        for d, _, files in os.walk(root) if any(f.endswith('.parquet') for f in files)])\
+        .sort_values(by=PARTITION_COLS).reset_index(drop=True)
+
+if __name__ == '__main__':
+    build_catalog()
+    print(list_partitions())
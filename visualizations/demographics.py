@@ -0,0 +1,221 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+############################################################################
+# Free-text demographics normalizer
+#
+# Year, State, Country and Gender are typed by participants, so every wave
+# brings new spellings and junk values ('19996', 'Los Angeles', 'US', ...).
+# Each column is factorized, the rules below run once on its *unique* values
+# (vectorized string ops), and the result is broadcast back to the rows
+# through the categorical codes - cost scales with distinct values, not rows.
+#
+# Raw value -> normalized value mappings are memoized in a JSON file, so a
+# rerun (or a new wave) only evaluates values never seen before. The file is
+# MAPPING_PATH (read at call time; set it to None to keep mappings in memory
+# only). Bump RULES_VERSION when a rule changes to discard the stored mappings.
+#
+# Derived columns follow R-analysis/final_project.Rmd : age = 2021 - birth
+# year (0 when unknown), age_bins, and isUS (NA when Country is missing).
+# One deliberate difference : R accepts any birth year up to 2021, so '2020'
+# gives age 1 there and age 0 (unknown) here, since participants are adults
+# (birth year <= REFERENCE_YEAR - MIN_AGE). Both land in the 'unknown' bin.
+#
+#   df = normalize_demographics(df)
+############################################################################
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+MAPPING_PATH = os.path.join(DATA_DIR, 'demographic_mappings.json')
+RULES_VERSION = 1
+
+REFERENCE_YEAR = 2021
+MIN_AGE = 18
+MIN_YEAR = 1900
+
+AGE_BREAKS = [-1, 17, 25, 30, 35, 40, 100]
+AGE_LABELS = ['unknown', '18-25', '26-30', '31-35', '36-40', '41+']
+
+USA = 'United States of America'
+UK = 'United Kingdom of Great Britain and Northern Ireland'
+
+#---------------------------------------------------------------------------
+## Reference Values
+#---------------------------------------------------------------------------
+
+US_STATES = OrderedDict({
+    'Alabama':'AL', 'Alaska':'AK', 'Arizona':'AZ', 'Arkansas':'AR', 'California':'CA',
+    'Colorado':'CO', 'Connecticut':'CT', 'Delaware':'DE', 'District of Columbia':'DC',
+    'Florida':'FL', 'Georgia':'GA', 'Hawaii':'HI', 'Idaho':'ID', 'Illinois':'IL',
+    'Indiana':'IN', 'Iowa':'IA', 'Kansas':'KS', 'Kentucky':'KY', 'Louisiana':'LA',
+    'Maine':'ME', 'Maryland':'MD', 'Massachusetts':'MA', 'Michigan':'MI', 'Minnesota':'MN',
+    'Mississippi':'MS', 'Missouri':'MO', 'Montana':'MT', 'Nebraska':'NE', 'Nevada':'NV',
+    'New Hampshire':'NH', 'New Jersey':'NJ', 'New Mexico':'NM', 'New York':'NY',
+    'North Carolina':'NC', 'North Dakota':'ND', 'Ohio':'OH', 'Oklahoma':'OK', 'Oregon':'OR',
+    'Pennsylvania':'PA', 'Rhode Island':'RI', 'South Carolina':'SC', 'South Dakota':'SD',
+    'Tennessee':'TN', 'Texas':'TX', 'Utah':'UT', 'Vermont':'VT', 'Virginia':'VA',
+    'Washington':'WA', 'West Virginia':'WV', 'Wisconsin':'WI', 'Wyoming':'WY', 'Puerto Rico':'PR',
+})
+
+STATE_ALIASES = {'washington dc':'District of Columbia', 'calif':'California', 'cali':'California', 'socal':'California',
+    'norcal':'California', 'bay area':'California', 'los angeles':'California',
+    'san francisco':'California', 'berkeley':'California', 'nyc':'New York', 'new york city':'New York'}
+
+COUNTRY_ALIASES = {'us':USA, 'usa':USA, 'united states':USA, 'america':USA, 'the united states':USA,
+    'uk':UK, 'united kingdom':UK, 'great britain':UK, 'britain':UK, 'england':UK,
+    'scotland':UK, 'wales':UK, 'northern ireland':UK, 'hong kong':'Hong Kong (S.A.R.)',
+    'prc':'China', "people's republic of china":'China'}
+
+# survey answer options; free text is only matched case / whitespace-insensitively
+GENDERS = ['Cisgender Woman', 'Cisgender Man', 'Transgender Woman', 'Transgender Man',
+    'Non-binary', 'Other', 'Prefer not to disclose']
+
+COLUMNS = ['Year', 'State', 'Country', 'Gender']
+
+#---------------------------------------------------------------------------
+## Rules : Index of unique raw strings -> (normalized values, status)
+#---------------------------------------------------------------------------
+
+def _clean(u):
+    return pd.Series(u, dtype=object).astype(str).str.strip().str.replace(r'\s+', ' ', regex=True)
+
+def _year_rules(u):
+    # numeric columns arrive as floats ('1999.0')
+    s = _clean(u).str.replace(r'\.0$', '', regex=True)
+    year = pd.to_numeric(s.where(s.str.fullmatch(r'\d{4}')), errors='coerce')
+    # five digits with one doubled digit ('19996') : drop the repeat, as in the R cleaning
+    fixed = pd.to_numeric(s.where(s.str.fullmatch(r'\d{5}')).str.replace(r'^(\d*?)(\d)\2(\d*)$', r'\1\2\3', regex=True)
+        .where(lambda x: x.str.len() == 4), errors='coerce')
+    latest = REFERENCE_YEAR - MIN_AGE
+    ok = year.between(MIN_YEAR, latest)
+    ok_fixed = ~ok & fixed.between(MIN_YEAR, latest)
+
+    value = year.where(ok).fillna(fixed.where(ok_fixed))
+    status = np.select([ok, ok_fixed, s.str.fullmatch(r'\d{1,2}')], ['valid', 'corrected', 'age'], 'invalid')
+    # two-digit entries are most likely ages, but that is a guess; they stay unknown
+    return [None if pd.isna(v) else int(v) for v in value], list(status)
+
+def _lookup_rules(s, canonical, aliases):
+    # case, whitespace and periods ('U.S.A.') are not significant
+    fold = lambda x: x.lower().replace('.', '')
+    key = s.str.lower().str.replace('.', '', regex=False)
+    exact = key.map({fold(c):c for c in canonical})
+    alias = key.map({fold(k):v for k, v in aliases.items()})
+    value = exact.fillna(alias)
+    status = np.select([exact.notna(), alias.notna()], ['valid', 'corrected'], 'invalid')
+    return value, status
+
+def _state_rules(u):
+    s = _clean(u)
+    abbr = {a.lower():name for name, a in US_STATES.items()}
+    value, status = _lookup_rules(s, US_STATES.keys(), dict(STATE_ALIASES, **abbr))
+    return [None if pd.isna(v) else v for v in value], list(status)
+
+def _country_rules(u):
+    s = _clean(u)
+    value, status = _lookup_rules(s, [USA, UK], COUNTRY_ALIASES)
+    # anything else is kept as entered (title-cased) : the survey offers a country list
+    keep = pd.isna(value) & s.str.contains(r'[A-Za-z]', regex=True) & ~s.str.contains(r'\d', regex=True)
+    value = value.where(~keep, s.where(s.str.lower() != s, s.str.title()))
+    status = np.where(keep, 'valid', status)
+    return [None if pd.isna(v) else v for v in value], list(status)
+
+def _gender_rules(u):
+    s = _clean(u)
+    value, status = _lookup_rules(s, GENDERS, {'non binary':'Non-binary', 'nonbinary':'Non-binary',
+        'prefer not to say':'Prefer not to disclose'})
+    # unrecognized free text is folded into Other rather than guessed at
+    other = pd.isna(value) & (s != '')
+    value = value.where(~other, 'Other')
+    status = np.where(other, 'corrected', status)
+    return [None if pd.isna(v) else v for v in value], list(status)
+
+RULES = OrderedDict({
+    'Year' : _year_rules,
+    'State' : _state_rules,
+    'Country' : _country_rules,
+    'Gender' : _gender_rules,
+})
+
+#---------------------------------------------------------------------------
+## Memoized mappings
+#---------------------------------------------------------------------------
+
+def _mapping_path(path):
+    return MAPPING_PATH if path is None else path
+
+def load_mappings(path=None):
+    path = _mapping_path(path)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)
+        if stored.get('version') == RULES_VERSION:
+            return stored
+    return {'version':RULES_VERSION}
+
+def save_mappings(mappings, path=None):
+    path = _mapping_path(path)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(mappings, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def normalize_column(series, column, mappings):
+    """
+    returns (values, status) as categoricals aligned with series; new raw
+    values are evaluated once and added to mappings[column]
+    """
+    codes, uniques = pd.factorize(series)
+    memo = mappings.setdefault(column, {})
+    keys = [str(u) for u in uniques]
+
+    new = [k for k in keys if k not in memo]
+    if new:
+        values, status = RULES[column](pd.Index(new))
+        memo.update({k:[v, st] for k, v, st in zip(new, values, status)})
+
+    # per unique raw value -> code of its normalized value / status, then one take per row
+    out = []
+    for i in (0, 1):
+        per_unique = pd.Series([memo[k][i] for k in keys], dtype=object)
+        u_codes, cats = pd.factorize(per_unique)
+        row_codes = np.where(codes >= 0, u_codes[codes] if len(u_codes) else -1, -1)
+        out.append(pd.Categorical.from_codes(row_codes, categories=cats))
+
+    # rows with no entry at all are 'missing' rather than 'invalid'
+    status = out[1].add_categories(['missing']) if 'missing' not in out[1].categories else out[1]
+    status[codes < 0] = 'missing'
+    return out[0], status
+
+def normalize_demographics(df, columns=None, path=None, persist=True):
+    # path : mapping file (default MAPPING_PATH); persist=False neither reads nor writes it
+
+    path = _mapping_path(path) if persist else None
+    mappings = load_mappings(path) if path else {'version':RULES_VERSION}
+    before = {c:len(mappings.get(c, {})) for c in RULES}
+
+    out = df.copy()
+    for c in (columns or [c for c in COLUMNS if c in df.columns]):
+        values, status = normalize_column(df[c], c, mappings)
+        if c == 'Year':
+            out['birth_year'] = pd.array(np.asarray(values, dtype=object), dtype='Int16')
+            out['year_status'] = status
+            age = (REFERENCE_YEAR - out.birth_year).fillna(0).astype(int)
+            out['age'] = age
+            out['age_bins'] = pd.cut(age, bins=AGE_BREAKS, labels=AGE_LABELS)
+        else:
+            out[c + '_norm'] = values
+            out[c.lower() + '_status'] = status
+        if c == 'Country':
+            out['isUS'] = (out.Country_norm == USA).astype('Int8').where(out.Country_norm.notna())
+
+    if path and any(len(mappings.get(c, {})) != before[c] for c in RULES):
+        save_mappings(mappings, path)
+
+    return out
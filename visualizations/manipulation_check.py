@@ -0,0 +1,194 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import os
+import bisect
+import numpy as np
+from array import array
+
+from stimuli import tokenize, WORD_RE
+
+############################################################################
+# Manipulation check : recount `length` and `mistakes` from the post text
+#
+# `length` and `mistakes` are otherwise trusted as supplied. This stage
+# tokenizes every displayed post (same tokenizer as stimuli.py), looks each
+# word up in a dictionary compiled into a packed trie, and recomputes
+#
+#   length   : number of words
+#   mistakes : words not in the dictionary, or - when the Control text of
+#              the same prompt is available - words that differ from it
+#              (which also catches homophone errors a dictionary accepts)
+#
+# then reports the discrepancies against the supplied columns per arm.
+# Participants overwhelmingly see identical texts, so checks run once per
+# distinct text and are memoized across calls.
+#
+#   lex = build_lexicon('/usr/share/dict/words', extra_texts=control_posts)
+#   checked = recount(df, lex, reference=control_posts)
+#   discrepancy_report(checked)
+############################################################################
+
+#---------------------------------------------------------------------------
+## Packed trie
+#---------------------------------------------------------------------------
+
+class PackedTrie:
+    # children of node i are labels[first[i]:first[i] + count[i]] (sorted) with
+    # matching node ids in child[]; terminal[i] marks the end of a word. Built
+    # breadth-first so each node's edges are contiguous and searched by bisect.
+
+    def __init__(self, words):
+        root = {}
+        for w in words:
+            node = root
+            for c in w:
+                node = node.setdefault(c, {})
+            node[''] = True
+
+        self.first, self.count = array('l'), array('l')
+        self.labels, self.child = [], array('l')
+        self.terminal = bytearray()
+
+        queue, head = [root], 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            edges = sorted(k for k in node if k)
+            self.first.append(len(self.labels))
+            self.count.append(len(edges))
+            self.terminal.append(1 if '' in node else 0)
+            for c in edges:
+                self.labels.append(c)
+                self.child.append(len(queue))
+                queue.append(node[c])
+
+        self.n_words = sum(self.terminal)
+        # per-lexicon memo of text checks; released with the lexicon
+        self.checked = {}
+
+    def __contains__(self, word):
+        node = 0
+        labels = self.labels
+        for c in word:
+            lo = self.first[node]
+            hi = lo + self.count[node]
+            i = bisect.bisect_left(labels, c, lo, hi)
+            if i == hi or labels[i] != c:
+                return False
+            node = self.child[i]
+        return bool(self.terminal[node])
+
+    def __len__(self):
+        return self.n_words
+
+def build_lexicon(path, extra_texts=None, extra_words=None):
+    # path : one-word-per-line list (e.g. /usr/share/dict/words where it exists),
+    # or None to build from extra_texts / extra_words alone
+
+    words = set()
+    if path:
+        if not os.path.exists(path):
+            raise FileNotFoundError("word list '%s' not found; pass path= to a one-word-per-line list" % path)
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            words.update(w.strip().lower() for w in f if w.strip())
+    # words in the Control (error-free) posts are correct by construction
+    for text in (extra_texts.values() if isinstance(extra_texts, dict) else extra_texts or []):
+        words.update(t.lower() for t in tokenize(text) if WORD_RE.match(t))
+    words.update(w.lower() for w in (extra_words or []))
+
+    return PackedTrie(sorted(words))
+
+#---------------------------------------------------------------------------
+## Per-text checks (memoized per lexicon)
+#---------------------------------------------------------------------------
+
+def _known(word, lexicon):
+    w = word.lower()
+    if w in lexicon:
+        return True
+    # possessives / contractions of known words ("author's", "didn't")
+    return "'" in w and w.split("'")[0] in lexicon
+
+def _check_text(text, lexicon, reference):
+    key = (text, reference)
+    if key in lexicon.checked:
+        return lexicon.checked[key]
+
+    words = [t for t in tokenize(text) if WORD_RE.match(t)]
+    unknown = [w for w in words if not _known(w, lexicon)]
+
+    diff = None
+    if reference is not None:
+        ref = [t for t in tokenize(reference) if WORD_RE.match(t)]
+        if len(ref) == len(words):
+            diff = sum(1 for a, b in zip(words, ref) if a != b)
+
+    lexicon.checked[key] = (len(words), len(unknown), diff, tuple(unknown))
+    return lexicon.checked[key]
+
+def check_text(text, lexicon, reference=None):
+    length, n_unknown, n_diff, unknown = _check_text(text, lexicon, reference)
+    return {'length':length, 'mistakes':n_diff if n_diff is not None else n_unknown,
+        'unknown_words':list(unknown), 'dictionary_mistakes':n_unknown, 'reference_mistakes':n_diff}
+
+#---------------------------------------------------------------------------
+## Frame-level recount & reports
+#---------------------------------------------------------------------------
+
+def recount(df, lexicon, text_col='text', prompt_col='Prompt', reference=None):
+    """
+    df : one row per displayed post (stimulus bank or participant log)
+    reference : optional {prompt : Control text}
+    adds length_recomputed / mistakes_recomputed and the match flags; rows with
+    no text (a log row with no match in the bank) get NA counts and fail both flags
+    """
+    reference = reference or {}
+    keys = df[[text_col, prompt_col]].drop_duplicates()
+    keys = keys[keys[text_col].notna()]
+
+    # one check per distinct (text, prompt); everything else is a broadcast
+    checked = [_check_text(t, lexicon, reference.get(p)) for t, p in zip(keys[text_col], keys[prompt_col])]
+    keys = keys.assign(
+        length_recomputed = [c[0] for c in checked],
+        mistakes_recomputed = [c[2] if c[2] is not None else c[1] for c in checked],
+        dictionary_mistakes = [c[1] for c in checked],
+        unknown_words = [' '.join(c[3]) for c in checked])
+
+    out = df.merge(keys, how='left', on=[text_col, prompt_col])
+    for c in ['length_recomputed', 'mistakes_recomputed', 'dictionary_mistakes']:
+        out[c] = out[c].astype('Int64')
+    if 'length' in out.columns:
+        out['length_ok'] = (out.length == out.length_recomputed).fillna(False).astype(bool)
+    if 'mistakes' in out.columns:
+        out['mistakes_ok'] = (out.mistakes == out.mistakes_recomputed).fillna(False).astype(bool)
+
+    return out
+
+def discrepancy_report(checked, by=('Treatment', 'Prompt')):
+
+    by = [c for c in by if c in checked.columns]
+    d = checked.assign(
+        length_diff = checked.length_recomputed - checked.length,
+        mistakes_diff = checked.mistakes_recomputed - checked.mistakes,
+        mismatched = ~(checked.length_ok & checked.mistakes_ok))
+
+    report = d.groupby(by=by).agg(
+        rows = ('length_diff', 'size'),
+        length_mismatches = ('length_ok', lambda s: int((~s).sum())),
+        mistakes_mismatches = ('mistakes_ok', lambda s: int((~s).sum())),
+        mean_length_diff = ('length_diff', 'mean'),
+        mean_mistakes_diff = ('mistakes_diff', 'mean'),
+        max_abs_mistakes_diff = ('mistakes_diff', lambda s: np.abs(s).max()),
+        pct_mismatched = ('mismatched', lambda s: round(s.mean() * 100, 2)))\
+        .reset_index()
+
+    return report
+
+def attach_stimuli(df, bank, on=('Prompt', 'Treatment', 'variant')):
+    # participant logs carry Prompt / Treatment (and a variant id, when one exists);
+    # bring in the displayed text from the stimulus bank
+    on = [c for c in on if c in df.columns and c in bank.columns]
+    cols = on + ['text']
+    return df.merge(bank[cols].drop_duplicates(subset=on), how='left', on=on)
@@ -0,0 +1,316 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import numpy as np
+import pandas as pd
+from collections import namedtuple, OrderedDict
+from scipy.special import expit, logit, ndtr, ndtri
+
+from data_catalog import cohort_labels
+
+############################################################################
+# Batched ordered-logit / ordered-probit estimator for the 7-point outcomes
+#
+#   P(y <= k | x) = F(theta_k - x'beta),   k = 1 .. K-1
+#
+# Many independent problems (outcomes x cohorts x specifications, or
+# bootstrap / randomization replicates) are stacked into (B, n, p) arrays and
+# solved together with a vectorized Newton-Raphson using analytic gradients
+# and Hessians. Both links have a log-concave CDF, so the log-likelihood is
+# concave in (beta, theta) and a step-halving Newton converges reliably.
+#
+# Problems are padded to a common n with zero-weight rows. Categories that a
+# problem never observes are collapsed (the matching cutpoints are reported
+# as NaN) so sparse cells don't send cutpoints off to infinity.
+#
+#   fit_many(df, outcomes=['Intelligence','Writing'], specs={'base':['Treatment']})
+############################################################################
+
+OUTCOMES = ['Intelligence', 'Writing', 'Effective', 'Interest', 'Meet']
+
+OrdinalBatchResult = namedtuple('OrdinalBatchResult',
+    ['beta', 'cutpoints', 'cutpoint_se', 'cov', 'se', 'loglik', 'converged', 'n_iter', 'n_obs', 'n_clusters'])
+
+#---------------------------------------------------------------------------
+## Link functions : (cdf, pdf, pdf')
+#---------------------------------------------------------------------------
+
+def _logit_link(z):
+    F = expit(z)
+    f = F * (1. - F)
+    return F, f, f * (1. - 2. * F)
+
+def _probit_link(z):
+    F = ndtr(z)
+    f = np.exp(-0.5 * z * z) / np.sqrt(2. * np.pi)
+    return F, f, -z * f
+
+LINKS = {'logit' : (_logit_link, logit), 'probit' : (_probit_link, ndtri)}
+
+#---------------------------------------------------------------------------
+## Core batched solver
+#---------------------------------------------------------------------------
+
+def _dense_categories(y, w, K):
+    # per problem, relabel observed categories to 0 .. K_b-1
+    B = y.shape[0]
+    counts = np.zeros((B, K))
+    np.add.at(counts, (np.repeat(np.arange(B), y.shape[1]), y.ravel()), (w > 0).ravel())
+    present = counts > 0
+    rank = np.cumsum(present, axis=1) - 1
+    yd = np.maximum(np.take_along_axis(rank, y, axis=1), 0)
+    return yd, present, present.sum(axis=1)
+
+def _components(psi, y, X, link, n_active):
+    # returns per-observation probability and the pieces of its derivatives
+    B, n, p = X.shape
+    beta, theta = psi[:, :p], psi[:, p:]
+    J = theta.shape[1]
+
+    eta = np.einsum('bnp,bp->bn', X, beta)
+    has_u = y < (n_active[:, None] - 1)
+    has_l = y > 0
+    ju = np.minimum(y, J - 1)
+    jl = np.maximum(y - 1, 0)
+    zu = np.where(has_u, np.take_along_axis(theta, ju, axis=1) - eta, 0.)
+    zl = np.where(has_l, np.take_along_axis(theta, jl, axis=1) - eta, 0.)
+
+    Fu, fu, dfu = link(zu)
+    Fl, fl, dfl = link(zl)
+    Fu, fu, dfu = np.where(has_u, Fu, 1.), np.where(has_u, fu, 0.), np.where(has_u, dfu, 0.)
+    Fl, fl, dfl = np.where(has_l, Fl, 0.), np.where(has_l, fl, 0.), np.where(has_l, dfl, 0.)
+
+    prob = np.maximum(Fu - Fl, 1e-300)
+    return prob, (fu, fl, dfu, dfl, ju, jl)
+
+def _loglik(psi, y, X, w, link, n_active):
+    prob, _ = _components(psi, y, X, link, n_active)
+    return np.sum(w * np.log(prob), axis=1)
+
+def _scores_hessian(psi, y, X, w, link, n_active):
+
+    B, n, p = X.shape
+    J = psi.shape[1] - p
+    prob, (fu, fl, dfu, dfl, ju, jl) = _components(psi, y, X, link, n_active)
+
+    # d z_u / d psi = (-x, e_ju) and d z_l / d psi = (-x, e_jl)
+    Eu = np.zeros((B, n, J)); np.put_along_axis(Eu, ju[..., None], 1., axis=2)
+    El = np.zeros((B, n, J)); np.put_along_axis(El, jl[..., None], 1., axis=2)
+    du = np.concatenate([-X, Eu], axis=2)
+    dl = np.concatenate([-X, El], axis=2)
+
+    # per-observation score of log p and its Hessian
+    g = (fu[..., None] * du - fl[..., None] * dl) / prob[..., None]
+    scores = w[..., None] * g
+    H = np.einsum('bn,bni,bnj->bij', w * dfu / prob, du, du) \
+        - np.einsum('bn,bni,bnj->bij', w * dfl / prob, dl, dl) \
+        - np.einsum('bni,bnj->bij', scores, g)
+
+    return scores, H
+
+def _mask_inactive(H, grad, active):
+    # inactive cutpoints get an identity Hessian row and zero gradient -> zero step
+    P = H.shape[1]
+    eye = np.eye(P)[None]
+    keep = (active[:, :, None] & active[:, None, :])
+    H = np.where(keep, H, 0.) - np.where(~active[:, :, None], eye, 0.)
+    return H, np.where(active, grad, 0.)
+
+def _ordered(psi, p, n_active):
+    theta = psi[:, p:]
+    diffs = np.diff(theta, axis=1)
+    active = np.arange(diffs.shape[1])[None] < (n_active[:, None] - 2)
+    return np.all(np.where(active, diffs > 0, True), axis=1)
+
+def fit_ordinal_batch(y, X, weights=None, clusters=None, link='logit', K=7,
+    max_iter=50, tol=1e-8, max_halving=30):
+    """
+    y : (B, n) int categories coded 0 .. K-1
+    X : (B, n, p) covariates (no intercept; the cutpoints absorb it)
+    weights : (B, n) case weights (0 for padding rows, bootstrap counts, ...)
+    clusters : (B, n) int cluster ids for participant-clustered errors
+    """
+    link_fn, inv_cdf = LINKS[link]
+    y = np.asarray(y, dtype=np.int64)
+    X = np.asarray(X, dtype=np.float64)
+    B, n, p = X.shape
+    J = K - 1
+    w = np.ones((B, n)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    yd, present, n_active = _dense_categories(y, w, K)
+    active = np.concatenate([np.ones((B, p), dtype=bool),
+        np.arange(J)[None] < (n_active[:, None] - 1)], axis=1)
+
+    # start : beta = 0, cutpoints at the inverse CDF of the cumulative marginals
+    counts = np.zeros((B, K))
+    np.add.at(counts, (np.repeat(np.arange(B), n), yd.ravel()), w.ravel())
+    cum = np.cumsum(counts, axis=1)[:, :J] / np.maximum(w.sum(axis=1, keepdims=True), 1e-12)
+    theta0 = inv_cdf(np.clip(cum, 1e-6, 1 - 1e-6))
+    fill = np.arange(J)[None] >= (n_active[:, None] - 1)
+    top = np.max(np.where(fill, -np.inf, theta0), axis=1, keepdims=True)
+    theta0 = np.where(fill, np.where(np.isfinite(top), top, 0.) + 1. + np.arange(J)[None], theta0)
+    psi = np.concatenate([np.zeros((B, p)), theta0], axis=1)
+
+    ll = _loglik(psi, yd, X, w, link_fn, n_active)
+    converged = np.zeros(B, dtype=bool)
+    n_iter = np.zeros(B, dtype=int)
+
+    for it in range(max_iter):
+        todo = ~converged
+        if not todo.any():
+            break
+        scores, H = _scores_hessian(psi[todo], yd[todo], X[todo], w[todo], link_fn, n_active[todo])
+        H, grad = _mask_inactive(H, scores.sum(axis=1), active[todo])
+        step = np.linalg.solve(-H, grad[..., None])[..., 0]
+
+        # vectorized step halving : keep the likelihood increasing and cutpoints ordered
+        t = np.ones(todo.sum())
+        new_psi = psi[todo] + step
+        new_ll = _loglik(new_psi, yd[todo], X[todo], w[todo], link_fn, n_active[todo])
+        for _ in range(max_halving):
+            bad = (new_ll < ll[todo] - 1e-10) | ~_ordered(new_psi, p, n_active[todo]) | ~np.isfinite(new_ll)
+            if not bad.any():
+                break
+            t = np.where(bad, t / 2., t)
+            new_psi = psi[todo] + t[:, None] * step
+            new_ll = _loglik(new_psi, yd[todo], X[todo], w[todo], link_fn, n_active[todo])
+        else:
+            # no acceptable step : stay put, the problem is at numerical precision
+            bad = (new_ll < ll[todo] - 1e-10) | ~_ordered(new_psi, p, n_active[todo]) | ~np.isfinite(new_ll)
+            t = np.where(bad, 0., t)
+            new_psi = np.where(bad[:, None], psi[todo], new_psi)
+            new_ll = np.where(bad, ll[todo], new_ll)
+
+        idx = np.flatnonzero(todo)
+        psi[idx] = new_psi
+        done = np.max(np.abs(t[:, None] * step), axis=1) < tol
+        ll[idx] = new_ll
+        n_iter[idx] += 1
+        converged[idx] = done
+
+    # covariance : inverse observed information, or the cluster-robust sandwich
+    scores, H = _scores_hessian(psi, yd, X, w, link_fn, n_active)
+    H, _ = _mask_inactive(H, scores.sum(axis=1), active)
+    bread = np.linalg.inv(-H)
+
+    if clusters is None:
+        cov = bread
+        n_clusters = None
+    else:
+        c = np.asarray(clusters, dtype=np.int64)
+        key = np.arange(B)[:, None] * (c.max() + 1) + c
+        uniq, inv = np.unique(key[w > 0], return_inverse=True)
+        S = np.zeros((uniq.shape[0], psi.shape[1]))
+        np.add.at(S, inv, scores[w > 0])
+        S = np.where(active[uniq // (c.max() + 1)], S, 0.)
+        meat = np.zeros((B, psi.shape[1], psi.shape[1]))
+        np.add.at(meat, uniq // (c.max() + 1), S[:, :, None] * S[:, None, :])
+        n_clusters = np.bincount(uniq // (c.max() + 1), minlength=B)
+        adj = (n_clusters / np.maximum(n_clusters - 1, 1))[:, None, None]
+        cov = adj * bread @ meat @ bread
+
+    cov = np.where(active[:, :, None] & active[:, None, :], cov, np.nan)
+    se = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+
+    # report cutpoints on the original K-1 boundaries (NaN where a category was empty)
+    cut, cut_se = np.full((B, J), np.nan), np.full((B, J), np.nan)
+    for b in range(B):
+        obs = np.flatnonzero(present[b])
+        cut[b, obs[1:] - 1] = psi[b, p:p + len(obs) - 1]
+        cut_se[b, obs[1:] - 1] = se[b, p:p + len(obs) - 1]
+
+    return OrdinalBatchResult(beta=psi[:, :p], cutpoints=cut, cutpoint_se=cut_se, cov=cov, se=se[:, :p], loglik=ll,
+        converged=converged, n_iter=n_iter, n_obs=(w > 0).sum(axis=1), n_clusters=n_clusters)
+
+def fit_ordinal(y, X, weights=None, clusters=None, link='logit', K=7, **kwargs):
+    # single-problem convenience wrapper; y coded 0 .. K-1
+    res = fit_ordinal_batch(np.asarray(y)[None], np.asarray(X, dtype=np.float64)[None],
+        None if weights is None else np.asarray(weights)[None],
+        None if clusters is None else np.asarray(clusters)[None], link=link, K=K, **kwargs)
+    return OrdinalBatchResult(*[None if v is None else v[0] for v in res])
+
+#---------------------------------------------------------------------------
+## Resampling (one batched fit per loop)
+#---------------------------------------------------------------------------
+
+def cluster_bootstrap(y, X, clusters, n_boot=200, link='logit', K=7, seed=0):
+    # participant-level bootstrap expressed as multinomial case weights, so all
+    # replicates are solved in a single batched call
+    rng = np.random.default_rng(seed)
+    codes, c = np.unique(clusters, return_inverse=True)
+    draws = rng.multinomial(len(codes), np.full(len(codes), 1. / len(codes)), size=n_boot)
+    W = draws[:, c].astype(np.float64)
+    B = n_boot
+    return fit_ordinal_batch(np.broadcast_to(y, (B,) + np.shape(y)),
+        np.broadcast_to(X, (B,) + np.shape(X)), weights=W, link=link, K=K)
+
+def randomization_draws(y, X, clusters, column=0, n_draws=200, link='logit', K=7, seed=0):
+    # re-randomize the treatment column at the participant level for a
+    # randomization-inference null distribution of its coefficient
+    rng = np.random.default_rng(seed)
+    codes, c = np.unique(clusters, return_inverse=True)
+    first = np.unique(c, return_index=True)[1]
+    assign = np.asarray(X)[first, column]
+    Xb = np.repeat(np.asarray(X, dtype=np.float64)[None], n_draws, axis=0)
+    for d in range(n_draws):
+        Xb[d, :, column] = rng.permutation(assign)[c]
+    return fit_ordinal_batch(np.broadcast_to(y, (n_draws,) + np.shape(y)), Xb, link=link, K=K)
+
+#---------------------------------------------------------------------------
+## Tidy interface over the live results table
+#---------------------------------------------------------------------------
+
+def _design(df, cols):
+    # categorical columns become treatment-coded dummies (first level, e.g.
+    # Control, is the baseline); there is no intercept column
+    return pd.get_dummies(df[cols], drop_first=True, dtype=np.float64).fillna(0.)
+
+def fit_many(df, outcomes=OUTCOMES, specs=None, cohorts=('All', 'Amazon', 'XLab'),
+    cluster='ROWID', link='logit'):
+
+    specs = specs or OrderedDict({'treatment' : ['Treatment']})
+    df = df.copy()
+    df['cohort'] = cohort_labels(df['Start Date'])
+    cl = pd.factorize(df[cluster])[0] if cluster else None
+
+    out = []
+    for spec, cols in specs.items():
+        # one batch per specification (shared column set), padded to a common n
+        design = _design(df, cols)
+        terms = list(design.columns)
+        problems = []
+        for outcome in outcomes:
+            for cohort in cohorts:
+                mask = df[outcome].notna() & df[cols].notna().all(axis=1)
+                if cohort != 'All':
+                    mask &= (df.cohort == cohort)
+                problems.append((outcome, cohort, np.flatnonzero(mask.values)))
+
+        B, nmax = len(problems), max(len(r) for _, _, r in problems)
+        Y = np.zeros((B, nmax), dtype=np.int64)
+        X = np.zeros((B, nmax, len(terms)))
+        W = np.zeros((B, nmax))
+        C = np.zeros((B, nmax), dtype=np.int64)
+        for b, (outcome, _, rows) in enumerate(problems):
+            Y[b, :len(rows)] = df[outcome].values[rows].astype(int) - 1
+            X[b, :len(rows)] = design.values[rows]
+            W[b, :len(rows)] = 1.
+            if cluster:
+                C[b, :len(rows)] = cl[rows]
+
+        res = fit_ordinal_batch(Y, X, weights=W, clusters=C if cluster else None, link=link)
+
+        for b, (outcome, cohort, rows) in enumerate(problems):
+            info = {'spec':spec, 'outcome':outcome, 'cohort':cohort, 'n':int(res.n_obs[b]),
+                'loglik':res.loglik[b], 'converged':bool(res.converged[b])}
+            for k, term in enumerate(terms):
+                out.append(dict(info, term=term, estimate=res.beta[b, k], se=res.se[b, k]))
+            for j in range(res.cutpoints.shape[1]):
+                out.append(dict(info, term='cut %d|%d' % (j + 1, j + 2),
+                    estimate=res.cutpoints[b, j], se=res.cutpoint_se[b, j]))
+
+    tidy = pd.DataFrame(out)
+    tidy['z'] = tidy.estimate / tidy.se
+    tidy['p_value'] = 2. * ndtr(-np.abs(tidy.z))
+    return tidy[['spec','outcome','cohort','term','estimate','se','z','p_value','n','loglik','converged']]
@@ -16,6 +16,10 @@ mpl.rcParams['font.serif'] = 'Times New Roman'
 from matplotlib import pyplot as plt
 import matplotlib.ticker as tck
 
+from profiling import profiled
+from demographics import normalize_demographics
+from balance import balance_table, SMD_THRESHOLD
+
 ############################################################################
 # Plotting Utilities, Constants, Methods for W209 arXiv project
 ############################################################################
@@ -164,6 +168,7 @@ alt.themes.enable("my_cal_theme")
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_divergence_data(df):
 
     df2_effective = df.groupby(by=['Treatment','Prompt','Effective']).ROWID.count().reset_index().sort_values(by=['Prompt','Effective','Treatment'])
@@ -222,6 +227,7 @@ def get_divergence_data(df):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def diverge_plot(data, question):
 
     color_scale = alt.Scale(
@@ -259,6 +265,7 @@ def diverge_plot(data, question):
     
     return alt.layer(p, l)
 
+@profiled
 def macro_diverge_plot(data, question, title):
 
     c = diverge_plot(data, question)\
@@ -291,6 +298,7 @@ def macro_diverge_plot(data, question, title):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def participant_count_plot(data):
 
     b = alt.Chart().mark_bar(line={'color':berkeley_palette['web_grey']}).encode(
@@ -324,6 +332,7 @@ def participant_count_plot(data):
     
     return p
 
+@profiled
 def participant_count_plot_live(data):
 
     df2 = data[['Start Date','Treatment','ROWID']].copy()
@@ -388,6 +397,7 @@ def color_all_missing_max(val):
     color = 'white' if val == df.shape[0] else 'black'
     return 'color: %s' % color
 
+@profiled
 def get_missing_demographics(df):
 
     cm = sns.light_palette("#0067B0", as_cmap=True)
@@ -411,21 +421,56 @@ def get_missing_demographics(df):
 ###################################################################################
 ###################################################################################
 
+## COVARIATE BALANCE ACROSS TREATMENT ARMS (HTML w/ PANDAS STYLER)
+
+###################################################################################
+###################################################################################
+
+def highlight_imbalance(s):
+    is_over = s.abs() > SMD_THRESHOLD
+    return ['background-color: %s; color: white' % berkeley_palette['golden_gate'] if v else '' for v in is_over]
+
+def highlight_significant(s):
+    is_sig = s < 0.05
+    return ['font-weight: bold' if v else '' for v in is_sig]
+
+@profiled
+def get_balance_report(df, draws=2000):
+
+    cm = sns.light_palette("#0067B0", as_cmap=True)
+
+    table, joint = balance_table(df, draws=draws)
+    arms = list(joint['n'].keys())
+    smd = [c for c in table.columns if c.startswith('SMD ')]
+
+    caption = 'Covariate Balance by Treatment Arm (%s) : joint permutation test p = %.3f (%d draws)' \
+        % (', '.join('%s n=%d' % (a, n) for a, n in joint['n'].items()), joint['p_value'], joint['draws'])
+
+    rend = table.style.bar(color = "#22a7f0", align = 'left', subset=arms)\
+        .background_gradient(cmap=cm, subset=['Max |SMD|'])\
+        .apply(highlight_imbalance, subset=smd)\
+        .apply(highlight_significant, subset=['p-value'])\
+        .set_caption(caption)\
+        .set_precision(2)
+
+    return rend
+
+###################################################################################
+###################################################################################
+
 ## DEMOGRAPHICS : YEAR DISTRIBUTION (GOOD DATA ONLY)
 
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_good_demographic_year(df):
 
-    df2 = df.copy()
-    df2.Year = df2.Year.fillna('<MISSING>')
-    df2 = pd.DataFrame(df2.groupby(by=['ROWID','Year']).size()\
-        .reset_index()[['ROWID','Year']].Year.value_counts(dropna=False))\
-        .reset_index().rename(columns={'index':'year', 'Year':'count'}).sort_values(by='year')
-
-    strange_values = ['19996','25','26','54','<MISSING>','Los Angeles','Mumbai, India','US','2020']
-    good = df2[(~df2.year.isin(strange_values))].copy()
+    # one row per participant; junk entries ('19996', 'Los Angeles', ...) are
+    # corrected or dropped by the demographics normalizer
+    df2 = normalize_demographics(df[['ROWID','Year']].drop_duplicates().dropna(), columns=['Year'])
+    good = df2.dropna(subset=['birth_year']).groupby(by='birth_year').size()\
+        .reset_index(name='count').rename(columns={'birth_year':'year'}).sort_values(by='year')
     good['year'] = good['year'].astype(int)
 
     p = alt.Chart(good).mark_bar(size=15, color=berkeley_palette['pacific'], line={'color':berkeley_palette['web_grey']})\
@@ -456,6 +501,7 @@ def get_good_demographic_year(df):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_demographic_gender(df):
 
     df2 = df.copy()
@@ -507,6 +553,7 @@ def get_demographic_gender(df):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_demographic_country(df):
 
     df2 = df.copy()
@@ -566,6 +613,7 @@ def get_demographic_country(df):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_demographic_state(df):
 
     df2 = df.copy()
@@ -617,6 +665,7 @@ def get_demographic_state(df):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_demographic_student_status(df):
 
     df2 = df.copy()
@@ -720,6 +769,7 @@ def get_demographic_student_status(df):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_descriptive_statistics(df, cols = None):
 
     if not cols:
@@ -738,6 +788,7 @@ def get_descriptive_statistics(df, cols = None):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_likert_variance(df):
 
     df2 = df.copy()
@@ -774,6 +825,7 @@ def get_likert_variance(df):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_likert_counts_by_group(df):
 
     df2 = df.copy()
@@ -827,6 +879,7 @@ def get_likert_counts_by_group(df):
 ###################################################################################
 ###################################################################################
 
+@profiled
 def get_wpm_plot(df):
 
     df2 = df.copy()
@@ -0,0 +1,300 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import io
+import os
+import sys
+import json
+import html
+import base64
+import asyncio
+import argparse
+import importlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import pandas as pd
+import altair as alt
+
+import matplotlib
+matplotlib.use('Agg')
+
+import demographics
+import data_catalog
+import balance
+import plot_utils
+from data_catalog import COHORTS, cohort_labels
+
+############################################################################
+# Local async preview server for plot_utils charts
+#
+# Loads the dataset once and serves every chart function as an endpoint :
+#
+#   http://localhost:8241/                                   index
+#   http://localhost:8241/chart/divergence?cohort=XLab&question=writing
+#   http://localhost:8241/chart/wpm?cohort=Amazon&format=json  (raw spec)
+#
+# Query parameters : cohort (All | Amazon | XLab), prompt (Accident, Diet,
+# ...), question (effective | intelligence | writing, divergence only) and
+# format (html | json). Any other key or value is rejected with 400 rather
+# than silently ignored.
+#
+# Generated specs live in an LRU keyed on (chart, parameters, data version,
+# code version). Saving plot_utils.py or a module its charts are built from
+# (WATCHED) reloads the code and saving the data file reloads the frame; both
+# invalidate the cache on the next request.
+# Concurrent requests for the same key share one computation, which runs in
+# a worker thread so the event loop stays responsive (a single worker :
+# pyplot and the profiling hooks are not thread-safe).
+#
+#   python preview_server.py [--data data/results_cleaned_04092021.csv] [--port 8241]
+############################################################################
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(HERE, 'data', 'results_cleaned_04092021.csv')
+
+# modules whose code ends up in a chart, in dependency order (reloaded together)
+WATCHED = [demographics, data_catalog, balance, plot_utils]
+
+QUESTIONS = ['effective', 'intelligence', 'writing']
+
+VEGA_SCRIPTS = ['https://cdn.jsdelivr.net/npm//vega@5',
+    'https://cdn.jsdelivr.net/npm//vega-lite@4.8.1',
+    'https://cdn.jsdelivr.net/npm//vega-embed@6']
+
+#---------------------------------------------------------------------------
+## Chart registry : endpoint -> callable(pu, df, params)
+#---------------------------------------------------------------------------
+
+def _divergence(pu, df, params):
+    return pu.macro_diverge_plot(pu.get_divergence_data(df), params.get('question', 'intelligence'), '')
+
+CHARTS = OrderedDict({
+    'divergence' : _divergence,
+    'participants' : lambda pu, df, params: pu.participant_count_plot_live(df),
+    'missing' : lambda pu, df, params: pu.get_missing_demographics(df),
+    'balance' : lambda pu, df, params: pu.get_balance_report(df),
+    'year' : lambda pu, df, params: pu.get_good_demographic_year(df),
+    'gender' : lambda pu, df, params: pu.get_demographic_gender(df),
+    'country' : lambda pu, df, params: pu.get_demographic_country(df),
+    'state' : lambda pu, df, params: pu.get_demographic_state(df),
+    'student' : lambda pu, df, params: pu.get_demographic_student_status(df),
+    'descriptive' : lambda pu, df, params: pu.get_descriptive_statistics(df,
+        ['PromptTime','QuestionTime','wpm','Interest','Effective','Intelligence','Writing','Meet']),
+    'likert_variance' : lambda pu, df, params: pu.get_likert_variance(df),
+    'likert_counts' : lambda pu, df, params: pu.get_likert_counts_by_group(df),
+    'wpm' : lambda pu, df, params: pu.get_wpm_plot(df),
+})
+
+PARAMS = ['cohort', 'prompt', 'question']
+
+#---------------------------------------------------------------------------
+## Data / code state with change detection
+#---------------------------------------------------------------------------
+
+def _stamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+class PreviewState:
+
+    def __init__(self, data_path=DATA_PATH, cache_size=64):
+        self.data_path = data_path
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.data_version = None
+        self.code_version = self.code_stamp()
+        self.df = None
+        self.cohort = None
+        self.hits = self.misses = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.refresh()
+
+    def code_stamp(self):
+        return tuple(_stamp(m.__file__) for m in WATCHED)
+
+    def load_data(self):
+        df = pd.read_csv(self.data_path)
+        df.drop(columns=['Unnamed: 0'], inplace=True, errors='ignore')
+        df['Start Date'] = pd.to_datetime(df['Start Date'].values)
+        return df
+
+    def refresh(self):
+        # cheap stat() per request; reload only what changed
+        data_version = _stamp(self.data_path)
+        code_version = self.code_stamp()
+        changed = False
+        if data_version != self.data_version:
+            self.df = self.load_data()
+            self.cohort = cohort_labels(self.df['Start Date'])
+            self.data_version = data_version
+            changed = True
+        if code_version != self.code_version:
+            # reload everything so modules re-bind names imported from a changed one
+            for m in WATCHED:
+                importlib.reload(m)
+            self.code_version = code_version
+            changed = True
+        if changed:
+            self.cache.clear()
+
+    def validate(self, params):
+        # returns an error message for parameter values no chart can serve
+        if params.get('cohort', 'All') not in ['All'] + COHORTS:
+            return 'unknown cohort %r; expected one of %s' % (params['cohort'], ['All'] + COHORTS)
+        prompts = list(self.df.Prompt.dropna().unique())
+        if params.get('prompt') and params['prompt'] not in prompts:
+            return 'unknown prompt %r; expected one of %s' % (params['prompt'], sorted(prompts))
+        if params.get('question') and params['question'] not in QUESTIONS:
+            return 'unknown question %r; expected one of %s' % (params['question'], QUESTIONS)
+        return None
+
+    def subset(self, params):
+        df = self.df
+        cohort = params.get('cohort', 'All')
+        if cohort != 'All':
+            df = df[(self.cohort == cohort)]
+        if params.get('prompt'):
+            df = df[(df.Prompt == params['prompt'])]
+        return df
+
+    def key(self, name, params):
+        # question only changes the divergence chart; elsewhere it would just duplicate entries
+        used = PARAMS if name == 'divergence' else [p for p in PARAMS if p != 'question']
+        return (name,) + tuple(params.get(p) for p in used) + (self.data_version, self.code_version)
+
+    async def get(self, name, params):
+        self.refresh()
+        key = self.key(name, params)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return await self.cache[key]
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        df = self.subset(params)
+        future = loop.run_in_executor(self.executor, render, CHARTS[name], plot_utils, df, params)
+        self.cache[key] = future
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        try:
+            return await future
+        except Exception:
+            self.cache.pop(key, None)
+            raise
+
+#---------------------------------------------------------------------------
+## Rendering (runs in a worker thread)
+#---------------------------------------------------------------------------
+
+def render(func, pu, df, params):
+    # returns (spec_json or None, html_body)
+    result = func(pu, df, params)
+
+    if result is pu.plt:
+        buf = io.BytesIO()
+        result.savefig(buf, format='png', dpi=100)
+        result.close('all')
+        return None, '<img src="data:image/png;base64,%s"/>' % base64.b64encode(buf.getvalue()).decode('ascii')
+
+    if hasattr(result, 'render'):
+        return None, result.render()
+
+    spec = json.dumps(result.to_dict())
+    body = '<div id="vis"></div><script type="text/javascript">vegaEmbed("#vis", %s);</script>' % spec
+    return spec, body
+
+def page(title, body):
+    scripts = ''.join('<script type="text/javascript" src="%s"></script>' % s for s in VEGA_SCRIPTS)
+    return '<!DOCTYPE html><html><head><meta charset="utf-8"><title>%s</title>%s</head><body>%s</body></html>' \
+        % (title, scripts, body)
+
+def index_page(state):
+    prompts = sorted(state.df.Prompt.dropna().unique())
+    links = ''.join('<li><a href="/chart/%s">%s</a></li>' % (n, n) for n in CHARTS)
+    return page('plot_utils preview', '<h2>plot_utils preview</h2><ul>%s</ul>'
+        '<p>cohort = All | Amazon | XLab &nbsp; prompt = %s &nbsp; question = effective | intelligence | writing</p>'
+        '<p>cache : %d entries, %d hits, %d misses</p>'
+        % (links, ' | '.join(prompts), len(state.cache), state.hits, state.misses))
+
+#---------------------------------------------------------------------------
+## Minimal HTTP/1.1 over asyncio streams
+#---------------------------------------------------------------------------
+
+async def respond(writer, status, body, content_type='text/html; charset=utf-8'):
+    payload = body.encode('utf-8') if isinstance(body, str) else body
+    writer.write(('HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n'
+        'Cache-Control: no-store\r\nConnection: close\r\n\r\n' % (status, content_type, len(payload))).encode('latin-1'))
+    writer.write(payload)
+    await writer.drain()
+    writer.close()
+
+async def handle(state, reader, writer):
+    try:
+        request = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        method, target = request.decode('latin-1').split(' ')[:2]
+    except Exception:
+        writer.close()
+        return
+
+    url = urlsplit(target)
+    query = parse_qs(url.query)
+    params = {k: v[0] for k, v in query.items() if k in PARAMS}
+    unknown = sorted(k for k in query if k not in PARAMS + ['format'])
+    fmt = query.get('format', ['html'])[0]
+
+    try:
+        if method != 'GET':
+            await respond(writer, '405 Method Not Allowed', 'GET only')
+        elif url.path in ('/', '/index.html'):
+            state.refresh()
+            await respond(writer, '200 OK', index_page(state))
+        elif url.path.startswith('/chart/') and url.path[7:] in CHARTS:
+            name = url.path[7:]
+            state.refresh()
+            if unknown:
+                error = 'unknown parameter %r; expected one of %s' % (unknown[0], PARAMS + ['format'])
+            elif fmt not in ('html', 'json'):
+                error = 'unknown format %r; expected html or json' % fmt
+            else:
+                error = state.validate(params)
+            if error:
+                await respond(writer, '400 Bad Request', html.escape(error))
+                return
+            spec, body = await state.get(name, params)
+            if fmt == 'json':
+                if spec is None:
+                    await respond(writer, '404 Not Found', '%s is not a vega-lite chart' % html.escape(name))
+                else:
+                    await respond(writer, '200 OK', spec, 'application/json')
+            else:
+                await respond(writer, '200 OK', page(name, body))
+        else:
+            await respond(writer, '404 Not Found', 'unknown endpoint %s' % html.escape(url.path))
+    except Exception as e:
+        await respond(writer, '500 Internal Server Error', '<pre>%s</pre>' % html.escape(repr(e)))
+
+async def serve(host='127.0.0.1', port=8241, data_path=DATA_PATH, cache_size=64):
+
+    # the full live study exceeds altair's default 5,000 row guard
+    alt.data_transformers.disable_max_rows()
+    state = PreviewState(data_path=data_path, cache_size=cache_size)
+    server = await asyncio.start_server(lambda r, w: handle(state, r, w), host, port)
+    sys.stdout.write('serving plot_utils previews on http://%s:%d/\n' % (host, port))
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve live previews of plot_utils charts.')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8241)
+    parser.add_argument('--cache-size', type=int, default=64)
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.host, args.port, args.data, args.cache_size))
@@ -0,0 +1,192 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import os
+import json
+import time
+import functools
+import tracemalloc
+import pandas as pd
+
+############################################################################
+# Opt-in hot-path instrumentation for plot_utils
+#
+# Every public plot_utils function is wrapped with @profiled. While profiling
+# is disabled (the default) the wrapper costs a single flag check per call,
+# so it can stay in production builds. Enable it with either
+#
+#   PLOT_UTILS_PROFILE=profile.jsonl  (environment variable), or
+#   enable_profiling('profile.jsonl', tag='live-04092021')
+#
+# and each call appends one JSON line with wall time, input rows / columns,
+# output rows, serialized spec size and inlined dataset size. Peak memory is
+# a separate opt-in (memory=True / PLOT_UTILS_PROFILE_MEMORY=1) : tracemalloc
+# slows allocation-heavy code several-fold, so records taken with it carry
+# traced=true and their wall times should not be compared with untraced ones.
+# profile_summary() aggregates a report into one table per function; use `tag`
+# to label waves / builds so regressions can be tracked over time.
+############################################################################
+
+class _ProfileState:
+    enabled = False
+    path = None
+    tag = None
+    memory = False
+    depth = 0
+    pending = []
+
+_state = _ProfileState()
+
+def enable_profiling(path='plot_utils_profile.jsonl', tag=None, memory=False):
+    _state.enabled = True
+    _state.path = path
+    _state.tag = tag
+    _state.memory = memory
+
+def disable_profiling():
+    _state.enabled = False
+
+def profiling_enabled():
+    return _state.enabled
+
+if os.environ.get('PLOT_UTILS_PROFILE'):
+    enable_profiling(os.environ['PLOT_UTILS_PROFILE'], tag=os.environ.get('PLOT_UTILS_PROFILE_TAG'),
+        memory=os.environ.get('PLOT_UTILS_PROFILE_MEMORY', '') not in ('', '0'))
+
+#---------------------------------------------------------------------------
+## Measurement helpers
+#---------------------------------------------------------------------------
+
+def _input_frame(args, kwargs):
+    for a in list(args) + list(kwargs.values()):
+        if isinstance(a, pd.DataFrame):
+            return a
+    return None
+
+def _describe_output(result):
+    # returns (output_rows, spec_bytes, dataset_bytes) for whatever the function produced
+    if isinstance(result, pd.DataFrame):
+        return result.shape[0], None, None
+
+    if hasattr(result, 'data') and isinstance(getattr(result, 'data'), pd.DataFrame) and hasattr(result, 'render'):
+        # pandas Styler
+        return result.data.shape[0], len(result.render().encode('utf-8')), None
+
+    if hasattr(result, 'to_dict') and hasattr(result, 'to_json'):
+        # altair chart : serialize once, measure the full spec and the inlined datasets
+        spec = result.to_dict()
+        datasets = spec.get('datasets', {})
+        rows = sum(len(v) for v in datasets.values()) if datasets else None
+        return rows, len(json.dumps(spec).encode('utf-8')), len(json.dumps(datasets).encode('utf-8'))
+
+    return None, None, None
+
+def _write_record(record):
+    with open(_state.path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+def _finish_record(record, result):
+    # a spec that can't stand alone (e.g. a layer awaiting facet data) is skipped
+    try:
+        rows, spec_bytes, dataset_bytes = _describe_output(result)
+    except Exception:
+        rows, spec_bytes, dataset_bytes = None, None, None
+    record.update({'output_rows' : None if rows is None else int(rows),
+        'spec_bytes' : spec_bytes, 'dataset_bytes' : dataset_bytes})
+    _write_record(record)
+
+#---------------------------------------------------------------------------
+## Decorator
+#---------------------------------------------------------------------------
+
+def profiled(func):
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _state.enabled:
+            return func(*args, **kwargs)
+
+        # only the outermost profiled call owns tracemalloc; nested calls
+        # (e.g. macro_diverge_plot -> diverge_plot) report the peak seen so far
+        owns_trace = _state.memory and not tracemalloc.is_tracing()
+        if owns_trace:
+            tracemalloc.start()
+        elif _state.memory and hasattr(tracemalloc, 'reset_peak') and _state.depth == 0:
+            tracemalloc.reset_peak()
+
+        df = _input_frame(args, kwargs)
+        error = None
+        _state.depth += 1
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            wall = time.perf_counter() - start
+            _state.depth -= 1
+            peak = tracemalloc.get_traced_memory()[1] if _state.memory and tracemalloc.is_tracing() else None
+            if owns_trace:
+                tracemalloc.stop()
+
+            record = {
+                'ts' : time.time(),
+                'tag' : _state.tag,
+                'function' : func.__name__,
+                'depth' : _state.depth,
+                'wall_s' : wall,
+                'traced' : bool(_state.memory),
+                'peak_bytes' : peak,
+                'input_rows' : None if df is None else int(df.shape[0]),
+                'input_cols' : None if df is None else int(df.shape[1]),
+                'output_rows' : None,
+                'spec_bytes' : None,
+                'dataset_bytes' : None,
+                'error' : error}
+
+            # nested calls : serializing their output now would land inside the
+            # caller's timed region, so it is measured once the outermost call returns
+            _state.pending.append((record, None if error else result))
+            if _state.depth == 0:
+                pending, _state.pending = _state.pending, []
+                for r, res in pending:
+                    if r['error'] is None:
+                        _finish_record(r, res)
+                    else:
+                        _write_record(r)
+
+        return result
+
+    return wrapper
+
+#---------------------------------------------------------------------------
+## Reporting
+#---------------------------------------------------------------------------
+
+def read_profile(path='plot_utils_profile.jsonl'):
+    return pd.read_json(path, lines=True)
+
+def profile_summary(path='plot_utils_profile.jsonl', by=('tag', 'function', 'traced')):
+
+    # traced and untraced timings are never averaged together
+    df = read_profile(path)
+    if 'traced' not in df.columns:
+        df['traced'] = df.peak_bytes.notna()
+    by = [c for c in by if c in df.columns and df[c].notna().any()]
+
+    summary = df.groupby(by=by).agg(
+        calls = ('wall_s', 'size'),
+        wall_mean_s = ('wall_s', 'mean'),
+        wall_p50_s = ('wall_s', 'median'),
+        wall_max_s = ('wall_s', 'max'),
+        peak_mb = ('peak_bytes', lambda s: s.max() / 2**20),
+        input_rows = ('input_rows', 'max'),
+        output_rows = ('output_rows', 'max'),
+        spec_kb = ('spec_bytes', lambda s: s.max() / 2**10),
+        dataset_kb = ('dataset_bytes', lambda s: s.max() / 2**10),
+        errors = ('error', 'count'))\
+        .sort_values(by='wall_mean_s', ascending=False)
+
+    return summary
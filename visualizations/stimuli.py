@@ -0,0 +1,305 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import re
+import hashlib
+import random
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+############################################################################
+# Deterministic stimulus generator for the Typographical / Phonological arms
+#
+# Takes a base post and an error spec (arm + number of mistakes) and produces
+# seeded variants with exactly that many misspelled words. Every variant
+# carries the `length` (word count) and `mistakes` (misspelled words) columns
+# the analysis already consumes, plus the list of edits that were applied.
+#
+#   Typographical : keyboard slips - adjacent-key substitution / insertion,
+#                   omission and transposition
+#   Phonological  : spelled-as-it-sounds errors - homophones and
+#                   sound-preserving spelling substitutions
+#
+# Variant seeds are derived from (seed, prompt, variant index) alone, so the
+# output is identical however the work is split across the process pool.
+#
+#   bank = generate_bank({'Diet': text}, arm='Phonological', mistakes=3, n_variants=1000)
+############################################################################
+
+ARMS = ['Control', 'Typographical', 'Phonological']
+
+#---------------------------------------------------------------------------
+## Keyboard adjacency (QWERTY), precompiled at import
+#---------------------------------------------------------------------------
+
+_KEYBOARD_ROWS = ['qwertyuiop', 'asdfghjkl', 'zxcvbnm']
+
+def _build_adjacency(rows):
+    pos = {c: (r, i) for r, row in enumerate(rows) for i, c in enumerate(row)}
+    adj = {}
+    for c, (r, i) in pos.items():
+        near = []
+        # same row neighbours, plus the keys above / below (rows are staggered by ~half a key)
+        for rr, ii in [(r, i - 1), (r, i + 1), (r - 1, i), (r - 1, i + 1), (r + 1, i - 1), (r + 1, i)]:
+            if 0 <= rr < len(rows) and 0 <= ii < len(rows[rr]):
+                near.append(rows[rr][ii])
+        adj[c] = tuple(near)
+    return adj
+
+KEYBOARD_ADJACENCY = _build_adjacency(_KEYBOARD_ROWS)
+
+#---------------------------------------------------------------------------
+## Phoneme-preserving substitutions, precompiled at import
+#---------------------------------------------------------------------------
+
+HOMOPHONES = OrderedDict({
+    'their':'there', 'there':'their', "they're":'there', 'your':"you're", "you're":'your',
+    'its':"it's", "it's":'its', 'to':'too', 'too':'to', 'then':'than', 'than':'then',
+    'were':'where', 'where':'were', 'whose':"who's", 'weather':'whether', 'whether':'weather',
+    'know':'no', 'new':'knew', 'right':'write', 'would':'wood', 'hear':'here', 'here':'hear',
+    'week':'weak', 'one':'won', 'by':'buy', 'piece':'peace', 'accept':'except', 'affect':'effect',
+    'effect':'affect', 'lose':'loose', 'through':'threw', 'break':'brake', 'heard':'herd',
+    'some':'sum', 'for':'four', 'which':'witch', 'made':'maid', 'meet':'meat', 'sea':'see',
+    'allowed':'aloud', 'past':'passed', 'whole':'hole', 'our':'are', 'because':'becuz',
+})
+
+# real words the sound rules reach from common words ('cent' -> 'sent', 'might'
+# -> 'mite', 'been' -> 'bean'); with the homophones and the post's own words
+# this is the real-word check when no lexicon is given
+SOUND_COLLISIONS = frozenset(['sent', 'sell', 'site', 'mite', 'rite', 'lite', 'now', 'not', 'new', 'nit',
+    'night', 'rest', 'rap', 'ring', 'wile', 'wine', 'wit', 'wet', 'were', 'bean', 'beat', 'weak', 'real',
+    'steal', 'heal', 'feat', 'flea', 'tea', 'pea', 'leak', 'peak', 'seam', 'sweat', 'beach'])
+KNOWN_WORDS = SOUND_COLLISIONS.union(HOMOPHONES.keys(), HOMOPHONES.values())
+
+# (pattern, replacement) applied inside a word; order matters only for priority.
+# Each rule is limited to the contexts where the respelling reads the same :
+# '-ed' only after a voiceless consonant, final '-y' only in longer unstressed
+# endings, 'ou' only before t / d / nd, and so on. Rules that change the sound
+# in common words ('ea' in great / head, 'wh' in who, 'oo', 'er', bare 'gh' and
+# final 'e' drops) are left out; check_sound_rules() pins every edit the rules
+# make on the live posts.
+SOUND_RULES = [
+    (r'ph', 'f'), (r'\b(en|r|t)ough\b', r'\1uff'), (r'(?<!e)ight\b', 'ite'), (r'(?<!s)tion\b', 'shun'),
+    (r'(?<=[sn])sion\b', 'shun'), (r'ck', 'k'), (r'que\b', 'k'), (r'ee(?!r)', 'ea'),
+    (r'(?<!c)ie(?=ve|f|ld|ce)', 'ei'), (r'(?<=c)ei(?=v|l)', 'ie'), (r'ou(?=t\b|d\b|nd)', 'ow'),
+    (r'\bc(?=[eiy])', 's'), (r'\bc(?=[aou])', 'k'), (r'x\b', 'ks'), (r'\bqu', 'kw'), (r'wh(?!o)', 'w'),
+    (r'\bkn', 'n'), (r'\bwr', 'r'), (r'(?<=u)mb\b', 'm'), (r'(?<=[ei])ll\b', 'l'), (r'(?<=[^u][ei])ss\b', 's'),
+    (r'ture\b', 'cher'), (r'(?<=\w{3}[^aeiouybf])(?<![pf]l)y\b', 'ee'),
+    (r'\b(\w*[aeiou]\w*(?:[pkfx]|[sc]h|ss))ed\b', r'\1t'),
+]
+SOUND_PATTERNS = [(re.compile(p), r) for p, r in SOUND_RULES]
+
+TOKEN_RE = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?|[^A-Za-z]+")
+WORD_RE = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?$")
+
+#---------------------------------------------------------------------------
+## Word-level error operators : (word, rng) -> (new_word, op) or None
+#---------------------------------------------------------------------------
+
+def _match_case(src, new):
+    if src.isupper() and len(src) > 1:
+        return new.upper()
+    if src[:1].isupper():
+        return new[:1].upper() + new[1:]
+    return new
+
+def typo_error(word, rng):
+    w = word.lower()
+    ops = ['substitute', 'insert', 'omit', 'transpose']
+    rng.shuffle(ops)
+    for op in ops:
+        letters = [i for i, c in enumerate(w) if c in KEYBOARD_ADJACENCY]
+        if op == 'substitute' and letters:
+            i = rng.choice(letters)
+            new = w[:i] + rng.choice(KEYBOARD_ADJACENCY[w[i]]) + w[i + 1:]
+        elif op == 'insert' and letters:
+            i = rng.choice(letters)
+            new = w[:i + 1] + rng.choice(KEYBOARD_ADJACENCY[w[i]]) + w[i + 1:]
+        elif op == 'omit' and len(w) > 2:
+            i = rng.randrange(1, len(w))
+            new = w[:i] + w[i + 1:]
+        elif op == 'transpose' and len(w) > 2:
+            pairs = [i for i in range(len(w) - 1) if w[i] != w[i + 1] and w[i].isalpha() and w[i + 1].isalpha()]
+            if not pairs:
+                continue
+            i = rng.choice(pairs)
+            new = w[:i] + w[i + 1] + w[i] + w[i + 2:]
+        else:
+            continue
+        if new != w:
+            return _match_case(word, new), op
+    return None
+
+def sound_options(w):
+    # every (rule, respelling) the sound rules allow for a lower-case word
+    options = []
+    for (rule, repl), (pattern, _) in zip(SOUND_RULES, SOUND_PATTERNS):
+        for m in pattern.finditer(w):
+            new = w[:m.start()] + m.expand(repl) + w[m.end():]
+            if new != w:
+                options.append((rule, new))
+    return options
+
+def phono_error(word, rng):
+    w = word.lower()
+    if w in HOMOPHONES:
+        return _match_case(word, HOMOPHONES[w]), 'homophone'
+    options = [new for rule, new in sound_options(w) if len(new) > 1]
+    if not options:
+        return None
+    return _match_case(word, rng.choice(options)), 'sound'
+
+OPERATORS = {'Typographical' : typo_error, 'Phonological' : phono_error}
+
+#---------------------------------------------------------------------------
+## Variant generation
+#---------------------------------------------------------------------------
+
+def tokenize(text):
+    return TOKEN_RE.findall(text)
+
+def count_words(text):
+    return sum(1 for t in tokenize(text) if WORD_RE.match(t))
+
+def variant_seed(seed, prompt, index):
+    digest = hashlib.sha256(('%s|%s|%d' % (seed, prompt, index)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+def make_variant(text, arm, mistakes, seed, lexicon=None):
+
+    if arm not in ARMS:
+        raise ValueError("unknown arm '%s'; expected one of %s" % (arm, ARMS))
+    if arm == 'Control' and mistakes:
+        raise ValueError('the Control arm carries no mistakes')
+
+    rng = random.Random(seed)
+    tokens = tokenize(text)
+    edits = []
+
+    # a slip that lands on a real word isn't a visible error; without a lexicon
+    # sound edits are still checked against the words they are known to reach
+    real = lexicon if lexicon else None
+    if real is None and arm == 'Phonological':
+        real = KNOWN_WORDS.union(t.lower() for t in tokens if WORD_RE.match(t))
+
+    if mistakes:
+        op = OPERATORS[arm]
+        # one error per word; single letters ('a', 'I') are never touched
+        candidates = [i for i, t in enumerate(tokens) if WORD_RE.match(t) and len(t) > 1]
+        rng.shuffle(candidates)
+        for i in candidates:
+            if len(edits) == mistakes:
+                break
+            res = op(tokens[i], rng)
+            # homophones are real words by design
+            if res is None or (real and res[1] != 'homophone' and res[0].lower() in real):
+                continue
+            edits.append({'index':i, 'original':tokens[i], 'error':res[0], 'op':res[1]})
+            tokens[i] = res[0]
+        if len(edits) < mistakes:
+            raise ValueError('post only supports %d %s errors (%d requested)' % (len(edits), arm, mistakes))
+
+    out = ''.join(tokens)
+    return {'text':out, 'length':count_words(out), 'mistakes':len(edits),
+        'edits':sorted(edits, key=lambda e: e['index'])}
+
+def _generate_chunk(args):
+    prompt, text, arm, mistakes, seed, indices, lexicon = args
+    return [dict(make_variant(text, arm, mistakes, variant_seed(seed, prompt, i), lexicon),
+        Prompt=prompt, Treatment=arm, variant=i, seed=variant_seed(seed, prompt, i)) for i in indices]
+
+def generate_bank(posts, arm, mistakes, n_variants=100, seed=241, processes=None, chunk_size=500, lexicon=None):
+    """
+    posts : {prompt name : base post text}
+    lexicon : optional lower-case valid words - a set, or anything supporting `in` such as
+    manipulation_check.build_lexicon(); errors that form a real word are rejected
+    returns a list of variant records with Prompt / Treatment / length / mistakes columns
+    """
+    jobs = [(prompt, text, arm, mistakes, seed, range(start, min(start + chunk_size, n_variants)), lexicon)
+        for prompt, text in posts.items() for start in range(0, n_variants, chunk_size)]
+
+    if processes == 1 or len(jobs) == 1:
+        chunks = map(_generate_chunk, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            chunks = list(pool.map(_generate_chunk, jobs))
+
+    return [rec for chunk in chunks for rec in chunk]
+
+def bank_to_frame(bank):
+    cols = ['Prompt', 'Treatment', 'variant', 'seed', 'length', 'mistakes', 'text']
+    return pd.DataFrame(bank)[cols]
+
+#---------------------------------------------------------------------------
+## Live posts and the sound-rule check
+#---------------------------------------------------------------------------
+
+# the six posts of the live study, as shown in pelican-site/content/img/social_media
+LIVE_POSTS = OrderedDict({
+    'Diet' : "I have good news and bad news! As you all know, I've been super diligent with keeping track of "
+        "calories and carbs on my keto diet. The good news is that it's the end of week 2 and I've lost almost "
+        "5 pounds! These results are much better than the vegan diet I tried before. That just did NOT work for "
+        "me. The bad news is I completely broke down today and gobbled up an Arby's roast beef sandwich. Food "
+        "never tasted so good! I guess one cheat day in 2 weeks is not so bad.",
+    'Sports' : "Eight months of hard work and practice finally pay off! It was an honor to compete in the state "
+        "finals and (finally) take home my first gold medal. Thank you all so much for the support and love!",
+    'Accident' : "I guess it was only a matter of time... I was late to work today because I got into an accident "
+        "with a person texting while driving!  My car is ruined; My nerves are shot, but I'm thankful to be safe "
+        "and sound.  Please pay attention and be safe out there!!",
+    'Music' : "Twenty-five years ago today, The Smashing Pumpkins released their album Mellon Collie & the "
+        "Infinite Sadness. I had just moved to Chicago from Kansas, away from home the first time in my early "
+        "twenties. This album defines that place and that moment like no other! Especially this song: Tonight, "
+        "Tonight. I still have to hear the lead up by the Mellon Collie instrumental or else something is "
+        "missing. Such heightened nights in the windy city.\n\"And the embers never fade in your city by the "
+        "lake. The place where you were born.\"",
+    'Science' : "Scientists at the South Hanoi Institute of Technology have succeeded in raising one dog with "
+        "five legs, another with a cow's liver, and a third with no head. On one hand, I find these outcomes "
+        "incredible, while on the other, I have ethical concerns with animal experimentation.",
+    'Mind' : "According to my favorite podcast, all native speakers have a grammatical competence that can "
+        "generate an infinite set of grammatical sentences from a finite set of resources. I cannot help but "
+        "wonder at how amazingly complex the human mind is!",
+})
+
+# every sound edit the rules make on the live posts, reviewed as reading the same
+# (edits onto real words are listed in KNOWN_WORDS instead and never applied)
+LIVE_SOUND_EDITS = frozenset([
+    ('beef', 'beaf'), ('calories', 'kalories'), ('carbs', 'karbs'), ('completely', 'kompletely'),
+    ('completely', 'completelee'), ('keeping', 'keaping'), ('pounds', 'pownds'), ('track', 'trak'),
+    ('weeks', 'weaks'), ('compete', 'kompete'), ('finally', 'finallee'), ('attention', 'attenshun'),
+    ('car', 'kar'), ('out', 'owt'), ('sound', 'sownd'), ('city', 'sity'), ('collie', 'kollie'),
+    ('early', 'earlee'), ('especially', 'especiallee'), ('sadness', 'sadnes'), ('still', 'stil'),
+    ('tonight', 'tonite'), ('twenty', 'twentee'), ('windy', 'windee'), ('concerns', 'koncerns'),
+    ("cow's", "kow's"), ('experimentation', 'experimentashun'), ('succeeded', 'succeaded'),
+    ('technology', 'technologee'), ('amazingly', 'amazinglee'), ('can', 'kan'), ('cannot', 'kannot'),
+    ('competence', 'kompetence'), ('complex', 'komplex'), ('complex', 'compleks'),
+])
+
+def sound_edits(posts=LIVE_POSTS):
+    # every (Prompt, word, rule, error) the sound rules produce on the words of posts
+    rows = []
+    for prompt, text in posts.items():
+        for word in sorted({t.lower() for t in tokenize(text) if WORD_RE.match(t)}):
+            # homophones take precedence in phono_error; the rules never see them
+            if word not in HOMOPHONES:
+                rows += [(prompt, word, rule, new) for rule, new in sound_options(word)]
+    return pd.DataFrame(rows, columns=['Prompt', 'word', 'rule', 'error'])
+
+def check_sound_rules(posts=LIVE_POSTS, reviewed=LIVE_SOUND_EDITS):
+    """
+    runs every sound rule over posts; an edit must either land on a known real
+    word (so make_variant rejects it) or be in the reviewed list
+    raises ValueError listing the unreviewed edits, returns the edits otherwise
+    """
+    edits = sound_edits(posts)
+    known = KNOWN_WORDS.union(edits.word)
+    new = [e for e in edits.itertuples() if e.error not in known and (e.word, e.error) not in reviewed]
+    if new:
+        raise ValueError('sound rules make unreviewed edits on the live posts :\n  ' + '\n  '.join(
+            '%s : %s -> %s (%s)' % (e.Prompt, e.word, e.error, e.rule) for e in new))
+    return edits
+
+if __name__ == '__main__':
+    edits = check_sound_rules()
+    print('%d sound edits over %d live posts, all reviewed' % (len(edits), len(LIVE_POSTS)))
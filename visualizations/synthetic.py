@@ -0,0 +1,88 @@
+############################################################################
+# IMPORTS
+############################################################################
+
+import os
+import numpy as np
+import pandas as pd
+
+############################################################################
+# Synthetic live-study data for benchmarking
+#
+# Produces frames with exactly the results_cleaned_04092021.csv schema (as
+# loaded by the notebook : index column dropped, `Start Date` parsed) at any
+# multiple of the real study size. Everything is resampled from the real
+# file so the distributions stay realistic :
+#   - participant demographics are bootstrapped as whole rows, keeping the
+#     joint structure and the real missingness pattern
+#   - treatment arms keep their observed shares
+#   - Likert / perception answers are bootstrapped jointly within each
+#     (Treatment, Prompt) cell; length & mistakes follow the stimulus design
+#   - Start Date keeps the Amazon / XLab cohort split, jittered within the day
+#
+#   df = generate_results(scale=100, seed=241)
+############################################################################
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+SOURCE_PATH = os.path.join(DATA_DIR, 'results_cleaned_04092021.csv')
+
+SCALES = [1, 10, 100, 1000]
+
+PARTICIPANT_COLS = ['Treatment', 'Year', 'Gender', 'English', 'Race', 'Country', 'State',
+    'Student', 'Degree', 'ReadSocialMedia', 'WriteSocialMedia', 'Start Date']
+RESPONSE_COLS = ['PromptTime', 'QuestionTime', 'Knowledge', 'Length', 'Interest', 'Effective',
+    'Intelligence', 'Writing', 'Meet', 'Errors']
+
+_source_cache = {}
+
+def load_source(path=SOURCE_PATH):
+
+    if path not in _source_cache:
+        df = pd.read_csv(path, dtype={'Year':str})
+        df.drop(columns=['Unnamed: 0'], inplace=True)
+        df['Start Date'] = pd.to_datetime(df['Start Date'].values)
+        _source_cache[path] = df
+
+    return _source_cache[path]
+
+def generate_results(scale=1, seed=0, source=None):
+
+    src = load_source() if source is None else source
+    rng = np.random.default_rng(seed)
+
+    columns = list(src.columns)
+    prompts = np.sort(src.Prompt.unique())
+    participants = src.drop_duplicates(subset='ROWID')[['ROWID'] + PARTICIPANT_COLS].reset_index(drop=True)
+    n = int(round(participants.shape[0] * scale))
+
+    # participant level : whole-row bootstrap keeps demographic missingness realistic
+    people = participants.iloc[rng.integers(0, participants.shape[0], n)].reset_index(drop=True)
+    people['ROWID'] = np.arange(1, n + 1)
+    day = people['Start Date'].dt.normalize()
+    people['Start Date'] = day + pd.to_timedelta(rng.integers(0, 86400, n), unit='s')
+
+    # long table : one row per participant x prompt, in the source's row order
+    k = len(prompts)
+    df = people.loc[np.repeat(np.arange(n), k)].reset_index(drop=True)
+    df['Prompt'] = np.tile(prompts, n)
+
+    # responses : joint bootstrap within each (Treatment, Prompt) cell
+    cell_index = src.groupby(by=['Treatment', 'Prompt']).indices
+    source_row = np.empty(df.shape[0], dtype=np.int64)
+    for (t, p), rows in df.groupby(by=['Treatment', 'Prompt']).indices.items():
+        pool = cell_index[(t, p)]
+        source_row[rows] = pool[rng.integers(0, len(pool), len(rows))]
+    responses = src[RESPONSE_COLS + ['length', 'mistakes']].iloc[source_row].reset_index(drop=True)
+    df = pd.concat([df, responses], axis=1)
+
+    df['wpm'] = df['length'] / df['PromptTime'] * 60.
+
+    return df[columns]
+
+def generate_scales(scales=SCALES, seed=0):
+    return {s: generate_results(scale=s, seed=seed) for s in scales}
+
+if __name__ == '__main__':
+    for s in SCALES:
+        df = generate_results(scale=s)
+        print('scale %5dx : %9d rows, %7d participants' % (s, df.shape[0], df.ROWID.nunique()))